@@ -14,25 +14,51 @@ auto-reloading module development library
 
 import os
 import sys
+import types
 
 from . import proxy
 from . import registry
 from . import autoimport
 from . import utils
+from . import vfs
+from . import bundle
 
 from .runner import runtest, testmod, testfocus, testonly
 from .proxy import wrap, unwrap
 from ._version import __version__
 from . import fakesite
 from .utils import execfile
+from .memo import memo, Memory
 
 
 
 _default = registry.FakeModuleRegistry()
+_default.finder.resolve_at = True  # unpickle objects of fake modules
+
+
+class _Package(types.ModuleType):
+    # The import system binds every module it imports on its parent,
+    # e.g. the `relmod.at("path")` names of pickled objects and their
+    # placeholders, see finder.AtLoader. They are not kept on relmod.
+    def __setattr__(self, name, value):
+        if name.startswith('at("'):
+            return
+        types.ModuleType.__setattr__(self, name, value)
+
+sys.modules[__name__].__class__ = _Package
 
 __all__ = ['at', 'up', 'install', 'reload', 'toplevel',
            'auto', 'runtest', 'testonly', 'testmod', 'testfocus',
-           'site', 'execfile', 'imp']
+           'site', 'execfile', 'imp', 'memo', 'Memory', 'ProcessPool',
+           'aat', 'areload']
+
+
+def __getattr__(name):
+    # imported on first use, it pulls in multiprocessing
+    if name == 'ProcessPool':
+        from .pool import ProcessPool
+        return ProcessPool
+    raise AttributeError(name)
 
 def at(pathname, inside='__file__'):
     """Create a module reference to the `pathname` string.
@@ -62,10 +88,19 @@ def install(globals=None):
     g = globals
     mod = _default.install(g)
     if g['__name__'] == '__main__':
-        __builtins__['__import__'] = _default.builtins.__import__
+        _main_package(g, mod)
     return mod
 
 
+def _main_package(g, mod):
+    # Relative imports of __main__ go through the import system, by
+    # the module name of its directory, see finder.AtLoader, instead
+    # of replacing builtins.__import__ for the whole process. Only
+    # `from . import` is resolved, there is no parent package.
+    _default.finder.resolve_at = True
+    g['__package__'] = mod.__name__
+
+
 def if_main(globals=None):
     """Install relmod only if run in __main__"""
     # use case: relative imports and testing in same file
@@ -75,14 +110,22 @@ def if_main(globals=None):
 
     g = globals
     if g['__name__'] == '__main__':
-        __builtins__['__import__'] = _default.builtins.__import__
         mod = _default.install(g)
+        _main_package(g, mod)
         return mod
 
 def reload(filename):
     """Reload a provided filename or module reference."""
     return _default.reload(filename)
 
+def aat(pathname, inside='__file__'):
+    """Awaitable `at`, loads in the event loop's executor."""
+    return _default.aat(pathname, inside)
+
+def areload(filename):
+    """Awaitable `reload`, reloads in the event loop's executor."""
+    return _default.areload(filename)
+
 def toplevel(toplevel, filename):
     """Register a toplevel name for import.
 
@@ -103,7 +146,7 @@ auto = autoimport.AutoImport()
 site = fakesite.create_default_site(_default)
 
 
-def imp(modname, fromlist=None, globals=None, abswarn=True):
+def imp(modname, fromlist=None, globals=None, abswarn=True, live=False):
     """Import names from a module into a provided namespace.
 
         If `modname` is a relative path string, it is normalized relative
@@ -113,6 +156,9 @@ def imp(modname, fromlist=None, globals=None, abswarn=True):
 
         relmod.imp('. as local')  # import local directory namespace as `local`
         relmod.imp('../file.py', 'funcA, func2 as funcB')
+
+        With `live=True`, the imported names are rebound in the namespace
+        whenever the source module is reloaded.
     """
     if globals is None:
         frame = sys._getframe()
@@ -136,7 +182,7 @@ def imp(modname, fromlist=None, globals=None, abswarn=True):
                 warnings.warn(fmods.AbsolutePathWarning(s), 'once',
                               stacklevel=2)
 
-    return _default.imp(modname, fromlist, globals)
+    return _default.imp(modname, fromlist, globals, live)
 
 
 def _imp_site(name, fromlist=None, globals=None):
@@ -206,22 +252,23 @@ def revdeps(dirs=True, files=True):
     __deps(_default._revdeps, dirs, files)
 
 def __deps(deps, dirs=True, files=True):
+    fs = _default.fs
 
     for k in sorted(deps.keys()):
         v = deps[k]
         if not files:
-            if os.path.isfile(k):
+            if fs.isfile(k):
                 continue
         if not dirs:
-            if os.path.isdir(k):
+            if fs.isdir(k):
                 continue
         print(k)
         for k2 in sorted(v.keys()):
             v2 = v[k2]
             if not files:
-                if os.path.isfile(k2):
+                if fs.isfile(k2):
                     continue
             if not dirs:
-                if os.path.isdir(k2):
+                if fs.isdir(k2):
                     continue
             print('\t %4i %s ' % (v2, k2))
@@ -0,0 +1,97 @@
+"""
+aio
+
+asyncio support. Loading runs in an executor, so the event loop does
+not block on stat, open, compile or module execution.
+
+    lib = await relmod.aat('./lib')
+    await relmod.areload(lib.work)
+
+    async for event in relmod._default.watch():
+        print(event.changed, event.affected)
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import asyncio
+import functools
+from collections import namedtuple
+
+from .cache import deep_check_list
+
+__all__ = ['ReloadEvent', 'run', 'watch']
+
+
+ReloadEvent = namedtuple('ReloadEvent', ['changed', 'affected', 'errors'])
+ReloadEvent.__doc__ = """\
+Files that changed on disk, the loaded modules that depend on them,
+and {filename: exception} for modules that failed to reload."""
+
+
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(None, call)
+
+
+def _fingerprint(stat):
+    return (stat.st_mtime, stat.st_size)
+
+
+def _changes(reg, seen):
+    # A file is compared against what was last reported for it, or
+    # else against the stat recorded when it was loaded, so an edit
+    # made before watching started is not missed.
+    changed = set()
+    with reg._modlock:
+        filestat = reg.cache.filestat
+        for fp, loaded in list(reg.cache.modstat.items()):
+            fing = _fingerprint(filestat.stat(fp))
+            if fing != seen.get(fp, _fingerprint(loaded)):
+                changed.add(fp)
+            seen[fp] = fing
+    return changed
+
+
+def _step(reg, seen, reload):
+    changed = _changes(reg, seen)
+    if not changed:
+        return None
+
+    affected = set()
+    for fp in changed:
+        affected.update(deep_check_list(fp, reg._revdeps))
+    affected = set(f for f in affected if f in reg.mods) - changed
+
+    errors = {}
+    if reload:
+        for fp in sorted(changed | affected):
+            if fp not in reg.mods:
+                continue
+            try:
+                reg._load_file(fp)
+            except Exception as e:
+                errors[fp] = e
+    return ReloadEvent(frozenset(changed), frozenset(affected), errors)
+
+
+async def watch(reg, interval=0.5, reload=True):
+    """Yield a ReloadEvent whenever tracked files change.
+
+       Every file the registry has loaded or tracked is checked each
+       `interval` seconds, against its stat at load time. With
+       `reload`, the changed and affected modules are reloaded before
+       the event is yielded.
+    """
+    seen = {}
+    while True:
+        await asyncio.sleep(interval)
+        event = await run(_step, reg, seen, reload)
+        if event is not None:
+            yield event
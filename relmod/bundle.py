@@ -0,0 +1,276 @@
+"""
+bundle
+
+A relmod tree packaged into a single archive for deployment.
+
+    relmod.bundle.build('./lib', './lib.relmod')
+
+    lib = relmod.at('./lib.relmod')   # same namespace as relmod.at('./lib')
+
+A bundle is a zip file holding every file of the tree, the marshalled
+code of each module compiled at build time, and an `index.json` with
+the file listing and the relative imports of each module. The archive
+is read with a single call and served from memory by `ArchiveFS`, so
+loading a module needs no open or compile on disk, and change checks
+stat only the bundle file. The imports in the index seed the
+registry's dependency graph when the bundle is mounted.
+
+Code compiled by a different Python version is ignored, and the module
+is compiled from the bundled source instead.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import io
+import os
+import ast
+import sys
+import json
+import stat
+import types
+import marshal
+import zipfile
+import warnings
+
+from . import vfs
+
+__all__ = ['build', 'ArchiveFS', 'EXTENSION']
+
+EXTENSION = '.relmod'
+FORMAT = 1
+
+_skip_dirs = ('__pycache__',)
+_skip_exts = ('.pyc', '.pyo')
+
+
+def _walk(src_dir):
+    for root, dirs, files in os.walk(src_dir):
+        dirs[:] = sorted(d for d in dirs
+                         if d not in _skip_dirs and not d.startswith('.'))
+        for f in sorted(files):
+            if f.startswith('.') or f.endswith(_skip_exts):
+                continue
+            p = os.path.join(root, f)
+            yield os.path.relpath(p, src_dir).replace(os.sep, '/')
+
+
+def _module_candidates(base, parts):
+    p = '/'.join([base] + parts if base else parts)
+    return [p + '.py', p + '/__init__.py']
+
+
+def _static_deps(relpath, tree, names):
+    """Relative imports of a module, as bundle paths.
+
+       Returns (found, missing).
+    """
+    found = set()
+    missing = set()
+    package = relpath.split('/')[:-1]
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ImportFrom) or not node.level:
+            continue
+        up = node.level - 1
+        if up > len(package):
+            missing.add('.' * node.level + (node.module or ''))
+            continue
+        base = '/'.join(package[:len(package) - up])
+        parts = node.module.split('.') if node.module else []
+
+        if parts:
+            cand = _module_candidates(base, parts)
+            hit = [c for c in cand if c in names]
+            if not hit:
+                missing.add('.' * node.level + node.module)
+                continue
+            found.update(hit)
+
+        # from . import name, where name may be a module
+        for alias in node.names:
+            for c in _module_candidates(base, parts + [alias.name]):
+                if c in names:
+                    found.add(c)
+    found.discard(relpath)
+    return sorted(found), sorted(missing)
+
+
+def build(src_dir, out, optimize=-1):
+    """Package the tree at `src_dir` into the bundle file `out`.
+
+       Modules are compiled with the running Python. Relative imports
+       that do not resolve within the tree are warned about. Returns
+       the index.
+    """
+    src_dir = os.path.abspath(os.path.expanduser(src_dir))
+    out = os.path.abspath(os.path.expanduser(out))
+    if not os.path.isdir(src_dir):
+        raise ValueError('not a directory %r' % src_dir)
+
+    names = [n for n in _walk(src_dir)
+             if os.path.join(src_dir, n) != out]
+    nameset = set(names)
+    files = {}
+    index = {
+        'format': FORMAT,
+        'cache_tag': sys.implementation.cache_tag,
+        'files': files,
+    }
+
+    tmp = out + '.tmp'
+    try:
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name in names:
+                with open(os.path.join(src_dir, name), 'rb') as fid:
+                    data = fid.read()
+                zf.writestr('src/' + name, data)
+                entry = files[name] = {'size': len(data)}
+                if not name.endswith('.py'):
+                    continue
+
+                tree = ast.parse(data, name)
+                code = compile(tree, name, 'exec', dont_inherit=True,
+                               optimize=optimize)
+                zf.writestr('code/' + name, marshal.dumps(code))
+                deps, missing = _static_deps(name, tree, nameset)
+                entry['deps'] = deps
+                for m in missing:
+                    warnings.warn('%s: import %r not found in bundle' %
+                                  (name, m))
+
+            zf.writestr('index.json', json.dumps(index, indent=1,
+                                                 sort_keys=True))
+        os.replace(tmp, out)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return index
+
+
+def _relocate(code, filename):
+    consts = tuple(
+        _relocate(c, filename) if isinstance(c, types.CodeType) else c
+        for c in code.co_consts)
+    return code.replace(co_filename=filename, co_consts=consts)
+
+
+class ArchiveFS(vfs.FileSystem):
+    """A bundle served from memory, rooted at the path of the bundle.
+
+       The bundle is read through `fs`, and read again when its stat
+       changes. Every file reports the modification time of the bundle
+       itself, so a rebuilt bundle reloads its modules.
+    """
+
+    def __init__(self, path, fs=None):
+        if fs is None:
+            fs = vfs.LocalFS()
+        self.root = os.path.abspath(path)
+        self.base = fs
+        self._read(fs.stat(self.root))
+
+    def _read(self, st):
+        self.mtime = st.st_mtime
+        self._fingerprint = (st.st_mtime_ns, st.st_size)
+        self._zip = zipfile.ZipFile(
+            io.BytesIO(self.base.read_bytes(self.root)))
+        self.index = json.loads(self._zip.read('index.json'))
+        if self.index.get('format') != FORMAT:
+            raise ValueError('unsupported bundle format %r' % self.root)
+        self._same_python = (self.index.get('cache_tag') ==
+                             sys.implementation.cache_tag)
+
+        self._files = {}  # path -> name in bundle
+        self._dirs = {self.root: set()}
+        for name in self.index['files']:
+            parts = name.split('/')
+            self._files[os.path.join(self.root, *parts)] = name
+            head = self.root
+            for p in parts[:-1]:
+                self._dirs[head].add(p)
+                head = os.path.join(head, p)
+                self._dirs.setdefault(head, set())
+            self._dirs[head].add(parts[-1])
+
+    def _refresh(self):
+        st = self.base.stat(self.root)
+        if (st.st_mtime_ns, st.st_size) != self._fingerprint:
+            self._read(st)
+
+    def _name(self, path):
+        name = self._files.get(os.path.abspath(path), None)
+        if name is None:
+            raise vfs._not_found(path)
+        return name
+
+    def stat(self, path):
+        path = os.path.abspath(path)
+        self._refresh()
+        if path in self._files:
+            mode = stat.S_IFREG | 0o444
+            size = self.index['files'][self._files[path]]['size']
+        elif path in self._dirs:
+            mode = stat.S_IFDIR | 0o555
+            size = 0
+        else:
+            raise vfs._not_found(path)
+        mtime = self.mtime
+        ns = int(mtime * 1e9)
+        return os.stat_result(
+            (mode, 0, 0, 1, 0, 0, size, mtime, mtime, mtime),
+            {'st_atime_ns': ns, 'st_mtime_ns': ns, 'st_ctime_ns': ns})
+
+    def listdir(self, path):
+        names = self._dirs.get(os.path.abspath(path), None)
+        if names is None:
+            raise vfs._not_found(path)
+        return sorted(names)
+
+    def open(self, path, mode='r', *args, **kwargs):
+        if any(c in mode for c in 'wax+'):
+            raise io.UnsupportedOperation('bundles are read-only')
+        fid = io.BytesIO(self._zip.read('src/' + self._name(path)))
+        if 'b' in mode:
+            return fid
+        encoding = kwargs.get('encoding', None) or 'utf8'
+        newline = kwargs.get('newline', None)
+        return io.TextIOWrapper(fid, encoding, newline=newline)
+
+    def isfile(self, path):
+        return os.path.abspath(path) in self._files
+
+    def isdir(self, path):
+        return os.path.abspath(path) in self._dirs
+
+    def exists(self, path):
+        path = os.path.abspath(path)
+        return path in self._files or path in self._dirs
+
+    def get_code(self, path):
+        if not self._same_python:
+            return None
+        path = os.path.abspath(path)
+        name = self._name(path)
+        try:
+            data = self._zip.read('code/' + name)
+        except KeyError:
+            return None
+        return _relocate(marshal.loads(data), path)
+
+    def files(self):
+        """Paths of the bundled files"""
+        return list(self._files)
+
+    def deps(self, path):
+        """Bundled modules imported relatively by the module at path"""
+        entry = self.index['files'][self._name(path)]
+        return [os.path.join(self.root, *d.split('/'))
+                for d in entry.get('deps', ())]
@@ -8,6 +8,10 @@
 
 from collections import defaultdict
 import os
+import threading
+import time
+
+from . import vfs
 
 _missing = object()
 
@@ -17,11 +21,97 @@ def _stat_changed(old_stat, new_stat):
     return old_stat.st_mtime != new_stat.st_mtime
 
 
-class FileStat:
+class SharedCache:
+    """File data shared by the registries of a process.
+
+       Source text and code objects are kept per file and keyed by the
+       file's (mtime_ns, size), so a new registry over a warm tree
+       neither reads nor compiles it again. Stat results are reused for
+       `stat_ttl` seconds, 0 stats every time. Module namespaces are
+       never shared. Only files of shared backends are kept, see
+       vfs.FileSystem.is_shared.
+    """
 
     def __init__(self):
+        self._lock = threading.Lock()
+        self.stat_ttl = 0
+        self._stats = {}  # path -> (time, stat)
+        self._files = {}  # path -> [fingerprint, source, code]
+        self.hits = 0
+        self.misses = 0
+
+    def stat(self, fs, path):
+        if not self.stat_ttl or not fs.is_shared(path):
+            return fs.stat(path)
+        now = time.monotonic()
+        entry = self._stats.get(path, None)
+        if entry is not None and now - entry[0] < self.stat_ttl:
+            return entry[1]
+        st = fs.stat(path)
+        with self._lock:
+            self._stats[path] = (now, st)
+        return st
+
+    def source(self, fs, path):
+        """Return (fingerprint, source text) of path, the fingerprint
+           is None if the file is not shared"""
+        if not fs.is_shared(path):
+            return None, fs.read_text(path)
+        st = self.stat(fs, path)
+        fing = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._files.get(path, None)
+            if entry is not None and entry[0] == fing:
+                self.hits += 1
+                return fing, entry[1]
+        src = fs.read_text(path)
+        with self._lock:
+            self.misses += 1
+            self._files[path] = [fing, src, None]
+        return fing, src
+
+    def code(self, path, fing, src):
+        """Return the module code of source src, read with fingerprint
+           fing from `source`"""
+        if fing is not None:
+            with self._lock:
+                entry = self._files.get(path, None)
+                if (entry is not None and entry[0] == fing and
+                        entry[2] is not None):
+                    return entry[2]
+        code = compile(src, path, 'exec', dont_inherit=True)
+        if fing is not None:
+            with self._lock:
+                entry = self._files.get(path, None)
+                if entry is not None and entry[0] == fing:
+                    entry[2] = code
+        return code
+
+    def forget(self, path):
+        """Drop the entries of path, so it is read and compiled again
+           even if its fingerprint did not change"""
+        with self._lock:
+            self._stats.pop(path, None)
+            self._files.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._files.clear()
+
+
+shared = SharedCache()  # used by every registry unless replaced
+
+
+class FileStat:
+
+    def __init__(self, fs=None, shared=None):
         self.stats = {}
         self.inhibit = False
+        if fs is None:
+            fs = vfs.LocalFS()
+        self.fs = fs
+        self.shared = shared
 
     def blank(self):
         return _blank_stat
@@ -35,7 +125,10 @@ class FileStat:
                 _blank_stat
             )
         try:
-            stat = os.stat(filename)
+            if self.shared is not None:
+                stat = self.shared.stat(self.fs, filename)
+            else:
+                stat = self.fs.stat(filename)
         except IOError:
             #return None
             stat = _blank_stat
@@ -69,7 +162,8 @@ def deep_check_list(filename, deps):
 class CacheSystem:
     def __init__(self, reg):
         self.reg = reg
-        self.filestat = FileStat()
+        self.filestat = FileStat(getattr(reg, 'fs', None),
+                                 getattr(reg, 'shared', None))
         self.modstat = {}
         self.check_invalid = True
 
@@ -79,6 +173,13 @@ class CacheSystem:
     def invalidate(self, filename):
         raise NotImplementedError
 
+    def _forget(self, filename):
+        # an explicit invalidation must not be answered from the
+        # shared cache, the edit may have kept mtime and size
+        shared = self.filestat.shared
+        if shared is not None:
+            shared.forget(filename)
+
 
 class CacheTracer(CacheSystem):
     def __init__(self, cache):
@@ -121,6 +222,7 @@ class NoCache(CacheSystem):
         return m, False
 
     def invalidate(self, filename):
+        self._forget(filename)
         return [filename]
 
 
@@ -149,6 +251,7 @@ class FirstLoadCache(CacheSystem):
         return reg.mods[filename], from_cache
 
     def invalidate(self, filename):
+        self._forget(filename)
         self._invalid.add(filename)
         return [filename]
 
@@ -185,7 +288,7 @@ class ShallowCache(CacheSystem):
 
 
     def invalidate(self,  filename):
-
+        self._forget(filename)
         if filename in self.modstat:
             self.modstat[filename] = self.filestat.blank()
         return [filename]
@@ -241,6 +344,10 @@ class SmartCache(CacheSystem):
 
             if changed:
                 file_changed.add(filename)
+                if file != filename and file not in reg.mods:
+                    # an opened file has one stat for all its readers,
+                    # mark them all before the first rebuild refreshes it
+                    self._invalidate(file)
 
         return file_changed
 
@@ -303,5 +410,6 @@ class SmartCache(CacheSystem):
 
     def invalidate(self, filename):
         reg = self.reg
+        self._forget(filename)
         inv = self._invalidate(filename)
         return list(inv)
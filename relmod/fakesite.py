@@ -11,20 +11,23 @@ import json
 from collections import defaultdict
 
 from .cache import FileStat
+from . import vfs
 
 
 
-def load_site(filename):
+def load_site(filename, fs=None):
+    if fs is None:
+        fs = vfs.LocalFS()
 
-    if os.path.isfile(filename):
-        with open(filename, 'r') as fid:
+    if fs.isfile(filename):
+        with fs.open(filename, 'r') as fid:
             try:
                 d = json.load(fid)
             except Exception:
                 print('Unable to load  %r' % filename, file=sys.stderr)
                 d = []
 
-    elif os.path.isdir(filename):
+    elif fs.isdir(filename):
         # treat a directory as load everything
         d = [['*', filename]]
     else:
@@ -51,10 +54,10 @@ def load_site(filename):
     return dd
 
 
-def _expand_star(path):
+def _expand_star(path, fs):
     dd = {}
-    if os.path.isdir(path):
-        for f in os.listdir(path):
+    if fs.isdir(path):
+        for f in fs.listdir(path):
             name = utils.fs_name_to_attr(f)
             if name == '':
                 continue
@@ -128,6 +131,7 @@ class _FakeSiteConfig:
         self.user_d[name] = value
 
     def _needs_load(self, fp):
+        self.filestat.fs = self.registry.fs  # follow the registry
         return self.filestat.file_changed(fp)
 
     @property
@@ -136,7 +140,7 @@ class _FakeSiteConfig:
             if fp_abs:
                 if self._needs_load(fp_abs):
                     try:
-                        d2 = load_site(fp_abs)
+                        d2 = load_site(fp_abs, self.registry.fs)
                     except Exception:
                         d2 = {}
 
@@ -145,7 +149,7 @@ class _FakeSiteConfig:
 
             if '*' in d:
                 for p in d['*']:
-                    dd = _expand_star(p)
+                    dd = _expand_star(p, self.registry.fs)
                     for k, v in dd:
                         d.setfault(k, v)
             yield d
@@ -5,31 +5,28 @@
 ## License:   BSD 2-Clause, see LICENSE file from project
 ##
 
-from __future__ import print_function
-
 import sys
 import types
 import os
+import importlib.machinery
 
 from . import proxy
 from . import utils
 
 
-class FakeLoader:
-    def __init__(self, fs):
-        self.fs = fs
-
-    def __getattr__(self, name):
-        #print('fl getattr', name)
-        raise AttributeError(name)
-
-    def load_module(self, *args):
-        fullname = self.fs.fullname
+class ToplevelLoader:
+    """Loader of the names registered with `toplevel`.
 
-        base, sep, rest = fullname.partition('.')
+       The spec carries (fullpath, use_proxy) as its loader_state, and
+       a submodule is found by walking the attributes of the toplevel
+       fake module.
+    """
+    def __init__(self, finder):
+        self.finder = finder
 
-        fullpath, use_proxy = self.fs.finder.toplevel[base]
-        reg = self.fs.finder.registry
+    def create_module(self, spec):
+        fullpath, use_proxy = spec.loader_state
+        reg = self.finder.registry
 
         mod = reg._load_file(fullpath)
         if mod.__file__:
@@ -38,57 +35,80 @@ class FakeLoader:
         mod.__dict__['__fakeproxy__'] = use_proxy
 
         # walk the name
+        rest = spec.name.partition('.')[2]
         while rest:
             name, sep, rest = rest.partition('.')
             mod = getattr(mod, name)
 
-        self.fs.origin = mod.__dict__['__file__']
+        spec.origin = mod.__dict__['__file__']
 
         if use_proxy:
-            wmod = proxy.wrap(mod)
-        else:
-            wmod = mod
-
-        sys.modules[fullname] = wmod
-        self.fs.finder._sysmods[fullname] = wmod
+            mod = proxy.wrap(mod)
+        self.finder._sysmods[spec.name] = mod
         return mod
 
-    # python 3.10
-    def create_module(self, spec):
-        return proxy.wrap(self.load_module())
-
     def exec_module(self, mod):
         pass
 
 
-class FakeSpec:
-    def __init__(self, finder, fullname, fullpath, use_proxy):
+class AtLoader:
+    """Loader of the `relmod.at("path")` module names.
 
-        self.finder = finder
-        self.fullname = fullname
-        self.use_proxy = use_proxy
+       The name of a fake module is not a dotted path, so its parent
+       names are given empty placeholder packages. This lets pickle
+       import the module of a function or class by name. Names below
+       it, e.g. `relmod.at("path").sub`, are found by attribute, as
+       in relative imports of an installed `__main__`.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.base = registry._toplevel_name
+        self.prefix = '%s.at("' % self.base
+
+    def split(self, fullname):
+        """Return (path, attribute names) of fullname, the path is None
+           for the parent of a path with dots"""
+        end = fullname.rfind('")')
+        if end < len(self.prefix):
+            return None, ()
+        rest = fullname[end + 2:]
+        if rest and rest[0] != '.':
+            return None, ()
+        return fullname[len(self.prefix):end], rest.split('.')[1:]
+
+    def find_spec(self, fullname):
+        if not fullname.startswith(self.prefix):
+            return None
+        path, names = self.split(fullname)
+        if path is None:
+            # parent of a path with dots
+            return importlib.machinery.ModuleSpec(
+                fullname, self, is_package=True)
+        return importlib.machinery.ModuleSpec(fullname, self, origin=path)
 
-        self.name = fullname
-        self.submodule_search_locations = []
-        self.loader = FakeLoader(self)
-        self.origin = fullpath
-        self.has_location = True
-        self.parent = fullname.rpartition('.')[0]
-        self.cached = None
-        self._initializing = False
+    def create_module(self, spec):
+        path, names = self.split(spec.name)
+        if path is None:
+            return types.ModuleType(spec.name)
+        reg = self.registry
+        mod = proxy.wrap(reg._load_file(path), '<import>')
+        for name in names:
+            mod = getattr(mod, name)
+        return mod
 
-    def __getattr__(self, name):
-        print('fs getattr', name)
-        raise AttributeError(name)
+    def exec_module(self, mod):
+        pass
 
 
 class FakeFinder:
-    def __init__(self, registry):
+    def __init__(self, registry, resolve_at=False):
         self.registry = registry
+        self.resolve_at = resolve_at  # import `relmod.at("path")` names
+        self.at_loader = AtLoader(registry)
+        self.loader = ToplevelLoader(self)
         sys.meta_path.insert(0, self)
-        self.toplevel = {}
+        self.toplevel = {}  # name -> (fullpath, use_proxy)
         self._sysmods = {}  # cache of what was added
-        self.__attr_print = set()
 
     def _remove_meta_path(self):
         if self in sys.meta_path:
@@ -101,14 +121,6 @@ class FakeFinder:
                     sys.modules.pop(k)
         self._sysmods.clear()
 
-    def __getattr__(self, name):
-        if name not in ('find_spec', '__qualname__'):
-            if name not in self.__attr_print:
-                print('ff getattr', name)
-                self.__attr_print.add(name)
-
-        raise AttributeError(name)
-
     def invalidate_caches(self, *args):
         pass
 
@@ -117,27 +129,20 @@ class FakeFinder:
         fp = utils.split_init(fp)
         self.toplevel[name] = (fp, proxy)
 
-    def _find_spec(self, fullname, path=None, target=None):
-        #print('find_spec', id(self), fullname, path, target)
-        for t, (fullpath, use_proxy) in self.toplevel.items():
-            if fullname.partition('.')[0] == t:
-                #print('--- find_spec', fullname)
-                return FakeSpec(self, fullname, fullpath, use_proxy)
-
-    # python 3.3
-    def find_module(self, fullname, path=None):
-        #print('find module', fullname)
-        spec = self._find_spec(fullname)
-        if spec is None:
-            return
-        return spec.loader
-
-
-    find_spec = _find_spec  # python 3.10
-
-    def load_module(self, fullname):
-        print('load module', fullname)
-        pass
+    def find_spec(self, fullname, path=None, target=None):
+        # Called for every import of the process, so a name that is
+        # not registered is one dict lookup.
+        base = fullname.partition('.')[0]
+        entry = self.toplevel.get(base, None)
+        if entry is None:
+            if self.resolve_at and base == self.at_loader.base:
+                return self.at_loader.find_spec(fullname)
+            return None
+        # every fake module carries its own __path__, so only the
+        # registered name needs a package spec
+        return importlib.machinery.ModuleSpec(
+            fullname, self.loader, origin=entry[0],
+            loader_state=entry, is_package=fullname == base)
 
     def __del__(self):
         try:
@@ -11,29 +11,55 @@ import builtins
 
 
 class FakeBuiltins(types.ModuleType):
+    """The builtins of fake modules, layered over `builtins`.
+
+       Its namespace is a plain dict holding the builtins and the
+       overrides, so names are found as fast as in any other module.
+       One instance is shared by every registry, an override finds the
+       registry of its caller, e.g. from the `globals` of `__import__`.
+       `sync` brings in later changes to the builtins module.
+    """
 
     def __init__(self, name, b=None):
         if b is None:
             b = builtins.__dict__
 
         types.ModuleType.__init__(self, name)
-        self.__dict__.update(b)
-        self.__dict__['__name__'] = name
+        self._base = b
+        self._name = name
+        self._overrides = {}
         self._orig = {}
+        self.sync()
+
+    _own = ('_base', '_name', '_overrides', '_orig')
+
+    def sync(self):
+        """Follow changes to the base namespace since the last call"""
+        d = self.__dict__
+        base = self._base
+        removed = d.keys() - base.keys()
+        removed.difference_update(self._own)
+        for k in removed:
+            del d[k]
+        d.update(base)
+        d['__name__'] = self._name
+        d.update(self._overrides)
 
     def _factory(self, name, factory):
         # the func is called with the original function
         # as its argument
         d = self.__dict__
-        orig = d[name]
+        orig = self._base[name]
         self._orig[name] = orig
 
         new_func = factory(orig)
-        d[name] = new_func
+        self._overrides[name] = d[name] = new_func
 
         return orig
 
     def override(self, name):
+        """Decorator replacing builtin `name` with factory(original).
+           The instance is shared, so this applies to every registry."""
         def wrapper(func):
             return self._factory(name, func)
         return wrapper
@@ -85,3 +111,7 @@ class FakeModuleType(types.ModuleType):
 
 class AbsolutePathWarning(Warning):
     pass
+
+
+class ClassUpgradeWarning(Warning):
+    pass
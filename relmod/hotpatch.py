@@ -0,0 +1,247 @@
+"""
+hotpatch
+
+Function-level patching of fake modules on reload.
+
+The newly compiled module code is compared against the code that was
+last executed. If the module and class bodies are unchanged apart from
+function bodies, the `__code__` of the live function objects is swapped
+in place and the module body is not executed again.
+
+After a full re-execution, classes can be upgraded in place so that
+existing instances pick up the new methods.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import types
+
+__all__ = ['patch_module', 'upgrade_classes']
+
+_CO_NEWLOCALS = 0x0002  # inspect.CO_NEWLOCALS
+
+
+def _is_function(code):
+    # lambdas and comprehensions are part of their enclosing body
+    return bool(code.co_flags & _CO_NEWLOCALS) and code.co_name[0] != '<'
+
+
+def _const_key(c):
+    # 1, 1.0 and True compare equal, the type keeps them apart
+    if isinstance(c, tuple):
+        return (tuple, tuple(_const_key(i) for i in c))
+    if isinstance(c, types.CodeType):
+        if _is_function(c):
+            return ('<function>', c.co_name, c.co_freevars)
+        return _shape(c)
+    return (type(c), c)
+
+
+def _shape(code):
+    """Return a comparable shape of a module or class body,
+       with the bodies of nested functions masked out."""
+    return (code.co_code,
+            getattr(code, 'co_exceptiontable', None),
+            code.co_names,
+            code.co_varnames,
+            code.co_freevars,
+            code.co_cellvars,
+            code.co_flags,
+            code.co_argcount,
+            getattr(code, 'co_posonlyargcount', 0),
+            code.co_kwonlyargcount,
+            tuple(_const_key(c) for c in code.co_consts))
+
+
+def _functions(code, prefix=''):
+    """Return (qualname, code) for functions defined in module and class
+       bodies. Nested functions are left to their enclosing function."""
+    found = []
+    for c in code.co_consts:
+        if not isinstance(c, types.CodeType):
+            continue
+        qualname = prefix + c.co_name
+        if _is_function(c):
+            found.append((qualname, c))
+        elif c.co_name[0] != '<':
+            found.extend(_functions(c, qualname + '.'))
+    return found
+
+
+def _live_functions(mod):
+    """Yield function objects reachable from the module namespace and
+       from the classes it defines."""
+    name = mod.__name__
+    seen = set()
+    todo = list(mod.__dict__.values())
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+
+        if isinstance(obj, types.ModuleType):
+            # don't trigger loads through proxies
+            continue
+
+        if isinstance(obj, types.FunctionType):
+            yield obj
+            todo.extend(obj.__dict__.values())
+        elif isinstance(obj, (staticmethod, classmethod)):
+            todo.append(obj.__func__)
+        elif isinstance(obj, property):
+            todo.extend([obj.fget, obj.fset, obj.fdel])
+        elif isinstance(obj, type):
+            if obj.__module__ == name:
+                todo.extend(obj.__dict__.values())
+
+        # functools.wraps, lru_cache and friends
+        wrapped = getattr(obj, '__wrapped__', None)
+        if wrapped is not None and not isinstance(obj, type):
+            todo.append(wrapped)
+
+
+def patch_module(mod, old_code, new_code):
+    """Swap function code in place if only function bodies differ
+       between `old_code` and `new_code`.
+
+       Returns True if the module was patched, False if the module
+       body needs a full re-execution.
+    """
+    if old_code is None:
+        return False
+
+    if _shape(old_code) != _shape(new_code):
+        return False
+
+    old_funcs = _functions(old_code)
+    new_funcs = _functions(new_code)
+    if [q for q, c in old_funcs] != [q for q, c in new_funcs]:
+        return False
+
+    new_map = dict(new_funcs)
+    if len(new_map) != len(new_funcs):
+        # the same qualname is defined twice, can't tell them apart
+        return False
+
+    by_code = {}
+    for qualname, code in old_funcs:
+        by_code[id(code)] = new_map[qualname]
+
+    todo = []
+    found = set()
+    for func in _live_functions(mod):
+        code = func.__code__
+        new = by_code.get(id(code), None)
+        if new is None:
+            continue
+        if code.co_freevars != new.co_freevars:
+            return False
+        todo.append((func, new))
+        found.add(id(code))
+
+    for qualname, code in old_funcs:
+        if id(code) not in found and code != new_map[qualname]:
+            # a changed function is no longer reachable
+            return False
+
+    for func, new in todo:
+        func.__code__ = new
+
+    return True
+
+
+# keep the layout of the old class, these belong to it
+_keep = ('__dict__', '__weakref__')
+
+
+def _layout(cls):
+    return (type(cls).__qualname__,
+            [(b.__module__, b.__qualname__) for b in cls.__bases__],
+            cls.__dict__.get('__slots__', None),
+            cls.__basicsize__,
+            cls.__itemsize__)
+
+
+def _fix_class_cell(obj, new, old):
+    # zero-argument super() looks up the __class__ cell
+    funcs = [obj]
+    if isinstance(obj, (staticmethod, classmethod)):
+        funcs = [obj.__func__]
+    elif isinstance(obj, property):
+        funcs = [obj.fget, obj.fset, obj.fdel]
+
+    for f in funcs:
+        if not isinstance(f, types.FunctionType) or not f.__closure__:
+            continue
+        for name, cell in zip(f.__code__.co_freevars, f.__closure__):
+            if name == '__class__' and cell.cell_contents is new:
+                cell.cell_contents = old
+
+
+def _upgrade(old, new):
+    for k in list(old.__dict__):
+        if k not in new.__dict__ and k not in _keep:
+            delattr(old, k)
+
+    for k, v in new.__dict__.items():
+        if k in _keep:
+            continue
+        if isinstance(v, types.MemberDescriptorType):
+            # __slots__ members are bound to their class
+            continue
+        _fix_class_cell(v, new, old)
+        setattr(old, k, v)
+
+
+def upgrade_classes(mod, old_classes):
+    """Patch the old class objects in place from their redefinitions,
+       then rebind the module namespace to the old classes.
+
+       `old_classes` maps global names to the classes that existed
+       before the module was executed again. Returns a list of
+       (name, reason) for classes that could not be upgraded, in which
+       case nothing is upgraded.
+    """
+    d = mod.__dict__
+    report = []
+    pairs = []
+    for name, old in old_classes.items():
+        new = d.get(name, None)
+        if new is old or not isinstance(new, type):
+            continue
+        if new.__qualname__ != old.__qualname__:
+            continue
+        if _layout(new) != _layout(old):
+            report.append((name, 'incompatible layout'))
+            continue
+        pairs.append((old, new))
+
+    if report:
+        # new subclasses refer to the new bases, upgrade all or nothing
+        return report
+
+    for old, new in pairs:
+        _upgrade(old, new)
+
+    # module-level references, including instances made during exec
+    swap = dict((id(new), old) for old, new in pairs)
+    for k, v in list(d.items()):
+        old = swap.get(id(v), None)
+        if old is not None:
+            d[k] = old
+            continue
+        old = swap.get(id(type(v)), None)
+        if old is not None:
+            try:
+                v.__class__ = old
+            except TypeError:
+                report.append((k, 'instance not upgraded'))
+
+    return report
@@ -0,0 +1,231 @@
+"""
+loaders
+
+Data files as fake modules.
+
+    lib = relmod.at('.')
+    lib.config       # config.json, top-level keys as attributes
+    lib.table        # table.csv, rows in `__data__`
+    lib.weights      # weights.npy, zero-copy view in `__data__`
+    lib.analysis     # analysis.ipynb, code cells as a module
+
+A loader is called as `loader(registry, filename, mod)` and fills the
+namespace of `mod`. Data modules are cached and reloaded on change like
+any other fake module, so a file is parsed once per change.
+
+A loader with a true `keep_namespace` attribute is given the previous
+namespace on reload instead of a fresh one.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import ast
+import csv
+import sys
+import json
+import mmap
+import hashlib
+
+from . import vfs
+
+__all__ = ['default_loaders', 'load_json', 'load_csv',
+           'load_npy', 'load_bin', 'load_ipynb']
+
+
+def _set_data(mod, data):
+    d = mod.__dict__
+    d['__data__'] = data
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if isinstance(k, str) and k.isidentifier() and k not in d:
+                d[k] = v
+
+
+def _map(fs, filename):
+    # read-only memory map, released with the last view on it
+    with fs.open(filename, 'rb') as fid:
+        try:
+            fileno = fid.fileno()
+        except (OSError, ValueError):
+            return memoryview(fid.read())  # not backed by a file
+        try:
+            mm = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return memoryview(b'')  # empty file
+    return memoryview(mm)
+
+
+def load_json(registry, filename, mod):
+    with registry.fs.open(filename, 'rb') as fid:
+        data = json.load(fid)
+    _set_data(mod, data)
+
+
+def load_csv(registry, filename, mod):
+    with registry.fs.open(filename, 'r', newline='') as fid:
+        data = list(csv.reader(fid))
+    _set_data(mod, data)
+
+
+def load_bin(registry, filename, mod):
+    _set_data(mod, _map(registry.fs, filename))
+
+
+# .npy descr to memoryview format, native byte order only
+_npy_formats = {
+    '|b1': '?', '|i1': 'b', '|u1': 'B',
+    '<i2': 'h', '<u2': 'H', '<i4': 'i', '<u4': 'I',
+    '<i8': 'q', '<u8': 'Q', '<f4': 'f', '<f8': 'd',
+}
+
+
+def _npy_view(fs, filename):
+    view = _map(fs, filename)
+    if bytes(view[:6]) != b'\x93NUMPY':
+        raise ValueError('not a .npy file: %r' % filename)
+    major = view[6]
+    if major == 1:
+        hlen = int.from_bytes(view[8:10], 'little')
+        offset = 10 + hlen
+    else:
+        hlen = int.from_bytes(view[8:12], 'little')
+        offset = 12 + hlen
+    header = ast.literal_eval(bytes(view[offset - hlen:offset]).decode('latin1'))
+
+    data = view[offset:]
+    fmt = _npy_formats.get(header['descr'], None)
+    if (fmt is None or header['fortran_order'] or
+            sys.byteorder != 'little'):
+        return data  # raw bytes
+
+    shape = header['shape']
+    if not shape:
+        shape = (1,)
+    if 0 in shape:
+        return data.cast(fmt)
+    return data.cast(fmt, shape)
+
+
+def load_npy(registry, filename, mod):
+    try:
+        import numpy
+    except ImportError:
+        data = _npy_view(registry.fs, filename)
+    else:
+        if isinstance(registry.fs, vfs.LocalFS):
+            data = numpy.load(filename, mmap_mode='r')
+        else:
+            with registry.fs.open(filename, 'rb') as fid:
+                data = numpy.load(fid)
+    _set_data(mod, data)
+
+
+def _strip_magics(src):
+    # IPython line magics and shell escapes
+    lines = src.splitlines()
+    for i, line in enumerate(lines):
+        body = line.lstrip()
+        if body[:1] in ('%', '!'):
+            indent = line[:len(line) - len(body)]
+            lines[i] = indent + 'pass  # ' + body
+    return '\n'.join(lines)
+
+
+def _base_name(node):
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+def _cell_names(tree):
+    """Return (defines, uses) of a cell, over-approximated."""
+    defines = set()
+    uses = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                uses.add(node.id)
+            else:
+                defines.add(node.id)
+        elif isinstance(node, (ast.Attribute, ast.Subscript)):
+            # x.a = ... and x[i] = ... modify x
+            if not isinstance(node.ctx, ast.Load):
+                name = _base_name(node)
+                if name:
+                    defines.add(name)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef)):
+            defines.add(node.name)
+        elif isinstance(node, ast.alias):
+            name = node.asname or node.name
+            defines.add(name.partition('.')[0])
+    return defines, uses
+
+
+def load_ipynb(registry, filename, mod):
+    """Execute the code cells of a notebook.
+
+       Compiled cells are cached by their source hash. On reload, only
+       new or edited cells run, along with later cells that use or
+       assign a name defined by a cell that ran.
+    """
+    with registry.fs.open(filename, 'rb') as fid:
+        nb = json.load(fid)
+
+    d = mod.__dict__
+    previous = d.get('__fakecells__', None) or {}
+    current = {}
+    dirty = set()
+    try:
+        index = 0
+        for cell in nb.get('cells', []):
+            if cell.get('cell_type') != 'code':
+                continue
+            src = cell.get('source', '')
+            if isinstance(src, list):
+                src = ''.join(src)
+            key = hashlib.sha1(src.encode('utf8')).hexdigest()
+
+            entry = previous.get(key, None)
+            if entry is None:
+                src = _strip_magics(src)
+                name = '%s[%i]' % (filename, index)
+                tree = ast.parse(src, name)
+                code = compile(tree, name, 'exec', dont_inherit=True)
+                defines, uses = _cell_names(tree)
+                entry = (code, defines, uses)
+                run = True
+            else:
+                code, defines, uses = entry
+                # a later assignment must win again, as in a fresh run
+                run = not (uses.isdisjoint(dirty) and
+                           defines.isdisjoint(dirty))
+
+            if run:
+                exec(code, d)
+                dirty.update(defines)
+            current[key] = entry
+            index += 1
+    finally:
+        # cells after a failure run again on the next load
+        d['__fakecells__'] = current
+
+load_ipynb.keep_namespace = True
+
+
+def default_loaders():
+    return {
+        '.json': load_json,
+        '.csv': load_csv,
+        '.npy': load_npy,
+        '.bin': load_bin,
+        '.ipynb': load_ipynb,
+    }
@@ -0,0 +1,502 @@
+"""
+memo
+
+Memoization that follows module reloads.
+
+    @relmod.memo(maxsize=256)
+    def expensive(x):
+        ...
+
+Cached results are tagged with the generation of the module defining
+the function and of every fake module it depends on. When one of them
+is reloaded, only the results computed under the old generation are
+dropped.
+
+Results can also be kept on disk across interpreter restarts:
+
+    mem = relmod.Memory('./.cache', maxbytes=2**30)
+
+    @mem.cache
+    def expensive(x):
+        ...
+
+The disk cache is keyed by a fingerprint of the function's code, the
+simple globals it reads, and the source of the fake modules it depends
+on, so results are recomputed only when that code changes.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import os
+import sys
+import mmap
+import types
+import pickle
+import hashlib
+import tempfile
+import time
+import weakref
+import functools
+import threading
+from collections import OrderedDict, namedtuple
+
+from .cache import deep_check_list
+
+__all__ = ['memo', 'MemoInfo', 'Memory']
+
+
+MemoInfo = namedtuple('MemoInfo', ['hits', 'misses', 'evictions',
+                                   'invalidations', 'maxsize',
+                                   'currsize', 'nbytes'])
+
+_kwmark = object()
+
+_memos = weakref.WeakSet()  # locks are reset in a forked child
+
+
+def _make_key(args, kwargs):
+    key = args
+    if kwargs:
+        key += (_kwmark,) + tuple(sorted(kwargs.items()))
+    return key
+
+
+class _Memo:
+    def __init__(self, func, maxsize=128, maxbytes=None):
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._maxsize = maxsize
+        self._maxbytes = maxbytes
+        self._lock = threading.RLock()
+        _memos.add(self)
+        self._entries = OrderedDict()  # key -> (stamp, result, nbytes)
+        self._nbytes = 0
+        self._hits = self._misses = 0
+        self._evictions = self._invalidations = 0
+        self._gen = None
+        self._stamp = ()
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return types.MethodType(self, obj)
+
+    def _registry(self):
+        g = self._func.__globals__
+        reg = g.get('__fakeregistry__', None)
+        file = g.get('__file__', None)
+        if reg is None or file is None:
+            return None, None
+        return reg, file
+
+    def _refresh(self):
+        # recompute the generation stamp after any registry rebuild
+        reg, file = self._registry()
+        if reg is None or self._gen == reg._gen:
+            return self._stamp
+
+        self._gen = reg._gen
+        files = deep_check_list(file, reg._deps)
+        files.add(file)
+        current = dict((f, reg._filegen.get(f, 0)) for f in files)
+        stamp = tuple(sorted(current.items()))
+        if stamp == self._stamp:
+            return stamp
+
+        self._resolve()
+        self._stamp = stamp
+
+        # drop only the results tied to a changed generation
+        for key, entry in list(self._entries.items()):
+            if any(current.get(f, -1) != gen for f, gen in entry[0]):
+                self._drop(key)
+                self._invalidations += 1
+            else:
+                self._entries[key] = (stamp,) + entry[1:]
+        return stamp
+
+    def _resolve(self):
+        # a wrapper created outside of the module follows its reloads
+        func = self._func
+        if '.' in func.__qualname__:
+            return
+        new = func.__globals__.get(func.__name__, None)
+        if isinstance(new, _Memo):
+            new = new._func
+        if (isinstance(new, types.FunctionType) and
+                new.__qualname__ == func.__qualname__):
+            self._func = self.__wrapped__ = new
+
+    def _drop(self, key):
+        stamp, result, nbytes = self._entries.pop(key)
+        self._nbytes -= nbytes
+
+    def _trim(self):
+        maxsize = self._maxsize
+        maxbytes = self._maxbytes
+        while self._entries:
+            if maxsize is not None and len(self._entries) > maxsize:
+                pass
+            elif maxbytes is not None and self._nbytes > maxbytes:
+                pass
+            else:
+                break
+            key = next(iter(self._entries))
+            self._drop(key)
+            self._evictions += 1
+
+    def __call__(self, *args, **kwargs):
+        key = _make_key(args, kwargs)
+        with self._lock:
+            stamp = self._refresh()
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            func = self._func
+
+        result = func(*args, **kwargs)
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            nbytes = sys.getsizeof(result)
+            self._entries[key] = (stamp, result, nbytes)
+            self._nbytes += nbytes
+            self._trim()
+        return result
+
+    def cache_info(self):
+        """Report cache statistics"""
+        with self._lock:
+            return MemoInfo(self._hits, self._misses, self._evictions,
+                            self._invalidations, self._maxsize,
+                            len(self._entries), self._nbytes)
+
+    def cache_clear(self):
+        """Clear the cache and statistics"""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self._hits = self._misses = 0
+            self._evictions = self._invalidations = 0
+
+
+def memo(func=None, *, maxsize=128, maxbytes=None):
+    """Memoize a function defined in a fake module.
+
+       `maxsize` bounds the number of entries and `maxbytes` the
+       approximate size of the results, as given by `sys.getsizeof`.
+       Either may be None for no bound. Results are invalidated when
+       the module or one of its dependencies is reloaded.
+    """
+    if func is None:
+        def wrapper(func):
+            return _Memo(func, maxsize, maxbytes)
+        return wrapper
+    return _Memo(func, maxsize, maxbytes)
+
+
+#----------------------
+# disk-persistent cache
+#----------------------
+
+_scalars = (int, float, complex, str, bytes, bool, type(None),
+            type(Ellipsis))
+_simple = _scalars + (tuple, frozenset, list, dict, set)
+
+_source_hashes = {}  # (filename, mtime_ns, size) -> digest
+_source_lock = threading.Lock()
+_index_lock = threading.Lock()
+
+
+def _source_hash(fs, filename):
+    try:
+        st = fs.stat(filename)
+    except OSError:
+        return ''
+    key = (filename, st.st_mtime_ns, st.st_size)
+    with _source_lock:
+        digest = _source_hashes.get(key, None)
+    if digest is None:
+        digest = hashlib.sha256(fs.read_bytes(filename)).hexdigest()
+        with _source_lock:
+            _source_hashes[key] = digest
+    return digest
+
+
+def _value_hash(h, v):
+    # Independent of PYTHONHASHSEED: the elements of a set are hashed
+    # in the order of their own digests, not in iteration order.
+    if isinstance(v, (set, frozenset)):
+        h.update(repr((type(v), len(v))).encode('utf8'))
+        for d in sorted(_digest(i) for i in v):
+            h.update(d)
+    elif isinstance(v, (tuple, list)):
+        h.update(repr((type(v), len(v))).encode('utf8'))
+        for i in v:
+            _value_hash(h, i)
+    elif isinstance(v, dict):
+        h.update(repr((type(v), len(v))).encode('utf8'))
+        for d in sorted(_digest(i) for i in v.items()):
+            h.update(d)
+    elif isinstance(v, _scalars):
+        h.update(repr((type(v), v)).encode('utf8'))
+    else:
+        h.update(pickle.dumps(v, 4))
+
+
+def _digest(v):
+    h = hashlib.sha256()
+    _value_hash(h, v)
+    return h.digest()
+
+
+def _code_hash(h, code, g, seen):
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf8'))
+    h.update(repr(code.co_varnames).encode('utf8'))
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            _code_hash(h, c, g, seen)
+        else:
+            _value_hash(h, c)
+
+    # globals read by the code: functions by their code,
+    # containers and scalars by their contents, anything else by type
+    for name in code.co_names:
+        if name in seen or name not in g:
+            continue
+        seen.add(name)
+        v = g[name]
+        h.update(name.encode('utf8'))
+        if isinstance(v, _Memo):
+            v = v._func
+        if isinstance(v, types.FunctionType) and v.__globals__ is g:
+            _code_hash(h, v.__code__, g, seen)
+        elif isinstance(v, _simple):
+            try:
+                _value_hash(h, v)
+            except Exception:
+                h.update(repr(type(v)).encode('utf8'))
+        else:
+            h.update(repr(type(v)).encode('utf8'))
+
+
+class _DiskMemo(_Memo):
+    def __init__(self, func, memory):
+        _Memo.__init__(self, func, maxsize=0)
+        self._memory = memory
+        self._fingerprint = None
+
+    def _fingerprint_now(self):
+        with self._lock:
+            reg, file = self._registry()
+            gen = None if reg is None else reg._gen
+            if self._fingerprint is not None and gen == self._gen:
+                return self._fingerprint
+            self._gen = gen
+            self._resolve()
+
+            func = self._func
+            h = hashlib.sha256()
+            h.update(func.__qualname__.encode('utf8'))
+            _code_hash(h, func.__code__, func.__globals__, set())
+            if reg is not None:
+                files = deep_check_list(file, reg._deps)
+                files.discard(file)  # covered by the code itself
+                for f in sorted(files):
+                    h.update(f.encode('utf8'))
+                    h.update(_source_hash(reg.fs, f).encode('utf8'))
+            self._fingerprint = h.hexdigest()
+            return self._fingerprint
+
+    def _folder(self):
+        func = self._func
+        name = '%s.%s' % (func.__module__, func.__qualname__)
+        folder = hashlib.sha256(name.encode('utf8')).hexdigest()[:16]
+        return os.path.join(self._memory.location, folder)
+
+    def _path(self, args, kwargs):
+        func = self._func
+        key = (args, tuple(sorted(kwargs.items())),
+               func.__defaults__, func.__kwdefaults__)
+        h = hashlib.sha256(self._fingerprint_now().encode('utf8'))
+        _value_hash(h, key)
+        return os.path.join(self._folder(), h.hexdigest() + '.pkl')
+
+    def __call__(self, *args, **kwargs):
+        path = self._path(args, kwargs)
+        try:
+            result = self._memory._load(path)
+        except Exception:
+            pass  # missing, truncated or no longer loadable
+        else:
+            with self._lock:
+                self._hits += 1
+            return result
+
+        with self._lock:
+            self._misses += 1
+        result = self._func(*args, **kwargs)
+        self._memory._store(path, result)
+        return result
+
+    def cache_info(self):
+        """Report cache statistics of this process"""
+        with self._lock:
+            return MemoInfo(self._hits, self._misses, 0, 0,
+                            None, None, self._memory.nbytes())
+
+    def cache_clear(self):
+        """Remove the stored results of this function"""
+        self._memory._remove_tree(self._folder())
+        with self._lock:
+            self._hits = self._misses = 0
+
+
+class Memory:
+    """Disk-persistent memoization in the `location` directory.
+
+       Results are pickled to one file each and written atomically,
+       so several processes may share the same location. `maxbytes`
+       caps the total size, evicting the least recently used files.
+    """
+
+    def __init__(self, location, maxbytes=None):
+        self.location = os.path.abspath(os.path.expanduser(location))
+        self.maxbytes = maxbytes
+        os.makedirs(self.location, exist_ok=True)
+        # path -> [atime, size] of the stored results, built by the
+        # first store with a size cap and kept up to date after that
+        self._index = None
+        self._total = 0
+
+    def cache(self, func):
+        """Decorator to store the results of `func` on disk"""
+        return _DiskMemo(func, self)
+
+    def _load(self, path):
+        with open(path, 'rb') as fid:
+            with mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                result = pickle.loads(mm)
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        with _index_lock:
+            entry = self._index and self._index.get(path, None)
+            if entry:
+                entry[0] = time.time()
+        return result
+
+    def _store(self, path, result):
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fid:
+                pickle.dump(result, fid, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        if self.maxbytes is not None or self._index is not None:
+            self._account(path)
+
+    def _account(self, path):
+        try:
+            size = os.stat(path).st_size
+        except OSError:
+            return
+        with _index_lock:
+            if self._index is None:
+                # the files of earlier runs and other processes
+                self._index = dict((p, [mtime, sz])
+                                   for mtime, sz, p in self._files())
+                self._total = sum(e[1] for e in self._index.values())
+            old = self._index.get(path, None)
+            if old is not None:
+                self._total -= old[1]
+            self._index[path] = [time.time(), size]
+            self._total += size
+            if self.maxbytes is not None and self._total > self.maxbytes:
+                self._trim()
+
+    def _files(self):
+        found = []
+        for root, dirs, files in os.walk(self.location):
+            for f in files:
+                if not f.endswith('.pkl'):
+                    continue
+                p = os.path.join(root, f)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue  # removed by another process
+                found.append((st.st_mtime, st.st_size, p))
+        return found
+
+    def nbytes(self):
+        """Total size of the stored results"""
+        return sum(size for mtime, size, p in self._files())
+
+    def _trim(self):
+        # called with _index_lock held
+        index = self._index
+        found = sorted((e[0], p) for p, e in index.items())
+        for mtime, p in found:
+            if self._total <= self.maxbytes:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                pass  # removed by another process
+            self._total -= index.pop(p)[1]
+
+    def _remove_tree(self, folder):
+        if not os.path.isdir(folder):
+            return
+        for f in os.listdir(folder):
+            try:
+                os.remove(os.path.join(folder, f))
+            except OSError:
+                pass
+        self._forget()
+
+    def _forget(self):
+        with _index_lock:
+            self._index = None
+            self._total = 0
+
+    def clear(self):
+        """Remove all stored results"""
+        for mtime, size, p in self._files():
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+        self._forget()
+
+
+def _after_fork_child():
+    global _source_lock, _index_lock
+    _source_lock = threading.Lock()
+    _index_lock = threading.Lock()
+    for m in list(_memos):
+        m._lock = threading.RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_child)
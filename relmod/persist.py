@@ -0,0 +1,91 @@
+"""
+persist
+
+Keep expensive module-level values across reloads.
+
+A fake module may declare the globals that survive a reload:
+
+    __persist__ = ['DATA', 'PATTERN']
+
+    DATA = load_dataset()
+    PATTERN = re.compile(...)
+
+On reload, a top-level assignment to persisted names is skipped if all
+of its names already exist in the module namespace and the source of
+the assignment is unchanged since it last ran.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import ast
+
+__all__ = ['persist_names', 'skip_persisted']
+
+
+def persist_names(tree):
+    """Return the names declared by a top-level `__persist__`."""
+    for stmt in tree.body:
+        if not isinstance(stmt, ast.Assign):
+            continue
+        if any(isinstance(t, ast.Name) and t.id == '__persist__'
+               for t in stmt.targets):
+            try:
+                names = ast.literal_eval(stmt.value)
+            except ValueError:
+                return ()
+            if isinstance(names, str):
+                names = names.replace(',', ' ').split()
+            return tuple(names)
+    return ()
+
+
+def _target_names(stmt):
+    # names bound by a simple assignment, None for anything else
+    if isinstance(stmt, ast.Assign):
+        targets = stmt.targets
+    elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+        targets = [stmt.target]
+    else:
+        return None
+
+    names = []
+    for t in targets:
+        if isinstance(t, (ast.Tuple, ast.List)):
+            elts = t.elts
+        else:
+            elts = [t]
+        for e in elts:
+            if not isinstance(e, ast.Name):
+                return None
+            names.append(e.id)
+    return names
+
+
+def skip_persisted(tree, names, d, previous):
+    """Replace the assignments of persisted names that can be reused
+       with `pass`.
+
+       `previous` maps a name to the source of the statement that last
+       assigned it. Returns the new mapping for this execution.
+    """
+    names = set(names)
+    current = {}
+    for index, stmt in enumerate(tree.body):
+        targets = _target_names(stmt)
+        if not targets or not names.issuperset(targets):
+            continue
+
+        src = ast.dump(stmt)
+        for n in targets:
+            current[n] = src
+
+        if all(n in d and previous.get(n) == src for n in targets):
+            tree.body[index] = ast.copy_location(ast.Pass(), stmt)
+
+    return current
@@ -0,0 +1,140 @@
+"""
+pool
+
+A process pool whose workers reload fake modules between tasks.
+
+    with relmod.ProcessPool(roots=['./lib']) as pool:
+        lib = relmod.at('./lib')
+        results = list(pool.map(lib.work.simulate, range(100)))
+
+        # edit ./lib/work.py, the same workers run the new code
+        results = list(pool.map(lib.work.simulate, range(100)))
+
+Functions of fake modules are sent by reference, their file and
+qualified name, and looked up in the worker's registry for every task.
+The parent publishes the generation of every file under `roots` in
+shared memory, see shm.py, so workers detect an edit at the same time
+without stat'ing the tree, and reload only the modules it affects.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from . import shm
+
+__all__ = ['ProcessPool']
+
+
+def _registry():
+    from . import _default
+    return _default
+
+
+class _FakeRef:
+    """A function of a fake module, by file and qualified name"""
+    __slots__ = ('file', 'qualname')
+
+    def __init__(self, file, qualname):
+        self.file = file
+        self.qualname = qualname
+
+    def __reduce__(self):
+        return (_FakeRef, (self.file, self.qualname))
+
+    def resolve(self):
+        obj = _registry()._load_file(self.file)
+        for name in self.qualname.split('.'):
+            obj = getattr(obj, name)
+        return obj
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return '<fakeref %s in %r>' % (self.qualname, self.file)
+
+
+def _by_reference(fn):
+    g = getattr(fn, '__globals__', None)
+    if not g or '__fakeregistry__' not in g:
+        return fn
+    file = g.get('__file__', None)
+    qualname = getattr(fn, '__qualname__', '')
+    if not file or '<locals>' in qualname:
+        return fn
+    return _FakeRef(file, qualname)
+
+
+def _init_worker(table_name, initializer, initargs):
+    if table_name is not None:
+        shm.attach(_registry(), table_name)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class ProcessPool(ProcessPoolExecutor):
+    """ProcessPoolExecutor for functions of fake modules.
+
+       Files under `roots` are scanned on submit, at most every
+       `interval` seconds, and changes are published to the workers.
+       Without `roots`, workers stat files themselves. Other arguments
+       are passed to ProcessPoolExecutor.
+    """
+
+    def __init__(self, max_workers=None, roots=(), interval=0.5,
+                 initializer=None, initargs=(), **kwargs):
+        if isinstance(roots, str):
+            roots = [roots]
+        if roots:
+            self._table = shm.SharedStatTable(create=True)
+            self._publisher = shm.Publisher(self._table, roots,
+                                            interval=interval)
+            self._publisher.scan()
+            name = self._table.name
+        else:
+            self._table = self._publisher = None
+            name = None
+        self._interval = interval
+        self._last_scan = time.monotonic()
+        self._scan_lock = threading.Lock()
+
+        ProcessPoolExecutor.__init__(
+            self, max_workers,
+            initializer=_init_worker,
+            initargs=(name, initializer, initargs),
+            **kwargs)
+
+    def publish(self):
+        """Publish file changes to the workers now"""
+        if self._publisher is None:
+            return []
+        with self._scan_lock:
+            self._last_scan = time.monotonic()
+            return self._publisher.scan()
+
+    def submit(self, fn, *args, **kwargs):
+        if (self._publisher is not None and
+                time.monotonic() - self._last_scan >= self._interval):
+            self.publish()
+        return ProcessPoolExecutor.submit(
+            self, _by_reference(fn), *args, **kwargs)
+
+    def map(self, fn, *iterables, **kwargs):
+        return ProcessPoolExecutor.map(
+            self, _by_reference(fn), *iterables, **kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        ProcessPoolExecutor.shutdown(self, wait, **kwargs)
+        if self._table is not None:
+            # attached workers keep their mapping
+            self._table.close()
+            self._table = self._publisher = None
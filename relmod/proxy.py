@@ -5,60 +5,100 @@
 ## License:   BSD 2-Clause, see LICENSE file from project
 ##
 
+import time
 import types
+import weakref
 from collections import defaultdict
-import os
 
 from . import utils
 from . import fmods
 
 
-_mp_fakedict = {}
+def _fresh(reg, hit):
+    # The loaded module is reused while no module of the registry was
+    # rebuilt, and either the stat table published no change to any
+    # file or `check_interval` has not passed. Otherwise the files are
+    # checked again by _load_file.
+    if hit[0] != reg._gen:
+        return False
+    if hit[1] is not None and hit[1] == reg._table.generation:
+        return True
+    return _monotonic() - hit[2] < reg.check_interval
+
 
 def _mp_get(self):
-    d = _mp_fakedict[id(self)]
-    fp = d[':filename:']
-    registry = d[':registry:']
-    m = registry._load_file(fp)
+    reg = _registry(self)
+    hit = _hit(self)
+    if _fresh(reg, hit):
+        m = hit[3]()
+        if m is not None:
+            return m
+    table = reg._table
+    tgen = None if table is None else table.generation  # before checks
+    m = reg._load_file(_filename(self))
+    if tgen is not None and not reg._published(m):
+        tgen = None
+    if tgen is not None or reg.check_interval:
+        _set_hit(self, (reg._gen, tgen, _monotonic(), weakref.ref(m), {}))
     return m
 
 
+# interned proxies, (registry, filename, inside) -> proxy
+_proxies = weakref.WeakValueDictionary()
+
+
 def _by_mod(mod, inside):
     # Could be a classmethod,
     # is not to avoid namespace pollution
-    reg = mod.__fakeregistry__
-    fp = mod.__file__
+    d = mod.__dict__
+    reg = d['__fakeregistry__']
+    fp = d['__file__']
     if fp is None:
-        fp = mod.__path__[0]
-    return ModuleProxy(reg, fp, inside)
+        fp = d['__path__'][0]
+    key = (reg, fp, inside)
+    p = _proxies.get(key, None)
+    if p is None:
+        p = _proxies.setdefault(key, ModuleProxy(reg, fp, inside))
+    elif inside and d['__file__'] is not None:
+        # the dependency is dropped when `inside` executes again
+        deps = reg._deps.get(inside, None)
+        if not deps or fp not in deps:
+            reg._add_dep(fp, inside)
+    return p
 
 
 class ModuleProxy(fmods.FakeModuleType):
     # allows for lazy loading
     # proxy to a particular file
 
+    # The state lives in slots, read and written through the slot
+    # descriptors, since attribute access is forwarded to the module.
+    # The proxies handed out for submodules are kept, so a chain such
+    # as lib.a.b from a live proxy finds them interned.
+    # The module is held weakly, so it can still be evicted.
+    __slots__ = ('__filename', '__registry', '__inside', '__kids',
+                 '__hit')
+
     def __init__(self, registry, filename, inside):
-        _mp_fakedict[id(self)] = fd = {}
-        fd[':filename:'] = filename
-        fd[':registry:'] = registry
-        fd[':inside:'] = inside
-        if os.path.isfile(filename):
+        _set_filename(self, filename)
+        _set_registry(self, registry)
+        _set_inside(self, inside)
+        _set_kids(self, {})
+        _set_hit(self, _no_hit)
+        if registry.fs.isfile(filename):
             if inside:
                 registry._add_dep(filename, inside)
 
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            sd = self.__fakedict__
-            od = other.__fakedict__
-            care = (':filename:', ':registry:')
-            return all([sd[n] == od[n] for n in care])
+            return (_filename(self) == _filename(other) and
+                    _registry(self) == _registry(other))
         else:
             return False
 
-    @property
-    def __fakedict__(self):
-        return _mp_fakedict[id(self)]
+    def __hash__(self):
+        return hash((_filename(self), _registry(self)))
 
     @property
     def __dict__(self):
@@ -71,20 +111,44 @@ class ModuleProxy(fmods.FakeModuleType):
         a = getattr(m, '__doc__')
         return a
 
-    def __getattr__(self, name):
-        m = _mp_get(self)
+    def __getattribute__(self, name):
+        # Forward everything but the attributes of the proxy type,
+        # without first failing a lookup on the proxy itself.
+        if name in _own_names:
+            return _generic_getattr(self, name)
+        reg = _registry(self)
+        hit = _hit(self)
+        if _fresh(reg, hit):
+            # submodule proxies are reused like the module
+            a = hit[4].get(name, None)
+            if a is not None:
+                return a
+            m = hit[3]()
+            if m is None:
+                m = _mp_get(self)
+        else:
+            m = _mp_get(self)
         a = getattr(m, name)
 
         if isinstance(a, fmods.FakeModuleType):
-            a = _by_mod(a, self.__fakedict__[':inside:'])
+            a = _kids(self)[name] = _by_mod(a, _inside(self))
+            hit = _hit(self)
+            if hit[0] == reg._gen:
+                hit[4][name] = a
         return a
 
+    def __getattr__(self, name):
+        # only reached after __getattribute__ failed
+        raise AttributeError('%s for %r' % (name, self))
+
     def __setattr__(self, name, value):
         m = _mp_get(self)
+        _set_hit(self, _no_hit)  # may replace a submodule
         return setattr(m, name, value)
 
     def __delattr__(self, name):
         m = _mp_get(self)
+        _set_hit(self, _no_hit)
         return delattr(m, name)
 
     def __getitem__(self, relpath):
@@ -96,9 +160,8 @@ class ModuleProxy(fmods.FakeModuleType):
         return dir(m)
 
     def __repr__(self):
-        d = self.__fakedict__
-        fp = d[':filename:']
-        if os.path.exists(fp):
+        fp = _filename(self)
+        if _registry(self).fs.exists(fp):
             missing = ''
         else:
             missing = '(MISSING)'
@@ -106,11 +169,23 @@ class ModuleProxy(fmods.FakeModuleType):
         name = '"%s"' % fp
         return "<moduleproxy %r%s>" % (fp, missing)
 
-    def __del__(self):
-        if _mp_fakedict is None:
-            # avoid system shutdown traceback
-            return
-        del _mp_fakedict[id(self)]
+
+_filename = ModuleProxy._ModuleProxy__filename.__get__
+_registry = ModuleProxy._ModuleProxy__registry.__get__
+_inside = ModuleProxy._ModuleProxy__inside.__get__
+_kids = ModuleProxy._ModuleProxy__kids.__get__
+_set_filename = ModuleProxy._ModuleProxy__filename.__set__
+_set_registry = ModuleProxy._ModuleProxy__registry.__set__
+_set_inside = ModuleProxy._ModuleProxy__inside.__set__
+_set_kids = ModuleProxy._ModuleProxy__kids.__set__
+_hit = ModuleProxy._ModuleProxy__hit.__get__
+_set_hit = ModuleProxy._ModuleProxy__hit.__set__
+# (registry generation, stat table generation, time of the check,
+#  module, submodule proxies)
+_no_hit = (None, None, 0, None, {})
+_monotonic = time.monotonic
+_generic_getattr = types.ModuleType.__getattribute__
+_own_names = frozenset(dir(ModuleProxy))
 
 
 def wrap(m, inside='__file__'):
@@ -9,19 +9,110 @@ from __future__ import print_function
 import sys
 
 import os
+import builtins
 import weakref
 import types
 from collections import defaultdict
 import threading
 import warnings
+import ast
+import gc
+import importlib.machinery
+import time
+from collections import OrderedDict
 
 from . import cache
 from . import fmods
 from . import utils
 from . import finder
 from . import proxy
+from . import hotpatch
+from . import persist
+from . import loaders
+from . import vfs
+from . import bundle
+from . import state
 
 _print = print
+_missing = object()
+
+
+# live registries, their locks are reset in a forked child
+_registries = weakref.WeakSet()
+
+
+def _before_fork():
+    # hold every lock, so no module is half-built in the child
+    for reg in list(_registries):
+        reg._modlock.acquire()
+
+
+def _after_fork_parent():
+    for reg in list(_registries):
+        reg._modlock.release()
+
+
+def _after_fork_child():
+    # Threads are not restarted in the child. The stat table of
+    # shm.Publisher has a single writer, which stays in the parent.
+    for reg in list(_registries):
+        reg._modlock = threading.RLock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork,
+                        after_in_parent=_after_fork_parent,
+                        after_in_child=_after_fork_child)
+
+
+_EVICT_SCAN = 32  # referenced modules skipped before evict gives up
+
+
+# builtins of fake modules, shared by all registries
+_builtins = fmods.FakeBuiltins('fake_builtins')
+
+
+@_builtins.override('__import__')
+def _import_factory(orig):
+    def _imp(name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 or not globals:
+            return orig(name, globals, locals, fromlist, level)
+        reg = globals.get('__fakeregistry__', None)
+        if reg is None:
+            return orig(name, globals, locals, fromlist, level)
+        return reg._import(name, globals, locals, fromlist, level)
+    return _imp
+
+
+@_builtins.override('open')
+def _open_factory(orig):
+    def _open(file, mode='r', *args, **kwargs):
+        reg = sys._getframe(1).f_globals.get('__fakeregistry__', None)
+        if reg is None:
+            return builtins.open(file, mode, *args, **kwargs)
+        return reg._open(file, mode, *args, **kwargs)
+    return _open
+
+
+def _nbytes(mod):
+    # shallow estimate of a module namespace
+    d = mod.__dict__
+    return sys.getsizeof(d) + sum(sys.getsizeof(v) for v in d.values())
+
+
+def _refcounts(mod):
+    # name -> (id, refcount) of the objects defined by the module,
+    # its functions, classes and instances of its classes
+    counts = {}
+    d = mod.__dict__
+    name = d.get('__name__', None)
+    for k, v in d.items():
+        try:
+            if v.__module__ == name:
+                counts[k] = (id(v), sys.getrefcount(v))
+        except:
+            pass
+    return counts
 
 
 def _wdict(mod):
@@ -38,9 +129,23 @@ def _wdict(mod):
     return wd
 
 
+def _from_imports(tree):
+    # (level, module) -> {name: [bound names]} of relative from-imports
+    found = defaultdict(lambda: defaultdict(list))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level:
+            names = found[(node.level, node.module or '')]
+            for alias in node.names:
+                names[alias.name].append(alias.asname or alias.name)
+    return dict((k, dict(v)) for k, v in found.items())
+
+
 class FakeModuleRegistry:
     def __init__(self):
         self._modlock = threading.RLock()
+        self._toplevel_name = __name__.partition('.')[0]
+        self._fs = vfs.LocalFS()
+        self.shared = cache.shared  # source and code shared by registries
         self.cache = cache.SmartCache(self)
         self.mods = {}
         self._deps = defaultdict(lambda: defaultdict(int))
@@ -49,25 +154,61 @@ class FakeModuleRegistry:
         self.log = None
         self._hard_reset = set()
         self._hard_reset_always = set()
+        self._hard_reset_persist = True  # keep __persist__ on hard reset
+        self._persisted = {}  # filename -> {name: assignment source}
+        self._patch = set()  # files reloaded by swapping function code
+        self._upgrade = set()  # files whose classes are upgraded in place
+        self._codes = {}  # filename -> last executed module code
+        self._warm = {}  # filename -> (fingerprint, code) from load_state
         self._active = set()
-        self._toplevel_name = __name__.partition('.')[0]
-
-        b = fmods.FakeBuiltins('fake_builtins')
-        @b.override('__import__')
-        def factory(orig):
-            self._orig_import = orig
-            def _imp(name, globals=None, locals=None, fromlist=(), level=0):
-                if level == 0:
-                    return orig(name, globals, locals, fromlist, level)
-                else:
-                    return self._import(name, globals, locals, fromlist, level)
-            return _imp
-        self._builtins = b
+        self._gen = 0  # bumped whenever any module is (re)built
+        self._filegen = {}  # filename -> self._gen at its last build
+        # seconds a ModuleProxy reuses its module without checking the
+        # files, 0 checks on every access unless a stat table covers
+        # them, see shm.attach
+        self.check_interval = 0
+        self._table = None  # shm.SharedStatTable once attached
+        self._impcache = {}  # relative import resolution cache
+        # source filename -> {key: [globals, name, attr, obj]}
+        self._bindings = defaultdict(dict)
+        self._bound = defaultdict(set)  # id(globals) -> source filenames
+        self._livenames = {}  # filename -> names bound by its from-imports
+        # optional eviction of unreferenced modules, None is no limit
+        self.max_modules = None
+        self.max_idle = None  # seconds since last access
+        self.max_bytes = None  # shallow size of the namespaces
+        self.evictions = 0
+        self._access = OrderedDict()  # filename -> last access, LRU order
+        self._sizes = {}  # filename -> namespace size estimate
+        self._refbase = {}  # filename -> _refcounts after execution
+        self._nbytes = 0
+        self.loaders = loaders.default_loaders()  # extension -> loader
+
+        # files opened for reading while a module executes
+        # become dependencies of that module
+        self._execstate = threading.local()
+        self._builtins = _builtins
+        self._orig_import = _builtins._orig['__import__']
+        _registries.add(self)
 
     @property
     def builtins(self):
+        """The builtins of fake modules. One FakeBuiltins is shared by
+           all registries, so an override affects every registry and
+           must dispatch on the registry of its caller."""
         return self._builtins
 
+    @property
+    def fs(self):
+        """The filesystem backend, see relmod.vfs"""
+        return self._fs
+
+    @fs.setter
+    def fs(self, fs):
+        self._fs = fs
+        self.cache.filestat.fs = fs
+        self.cache.filestat.stats.clear()
+
     def _add_dep(self, file, inside):
         if inside:
             self._deps[inside][file] += 1
@@ -80,6 +221,24 @@ class FakeModuleRegistry:
         r = self._revdeps[file].pop(inside, None)
         return d, r
 
+    def _open(self, file, mode='r', *args, **kwargs):
+        if (isinstance(file, (str, os.PathLike)) and
+                not any(c in mode for c in 'wax+')):
+            stack = getattr(self._execstate, 'stack', None)
+            if stack:
+                self._track_open(file, stack[-1])
+            return self.fs.open(file, mode, *args, **kwargs)
+        return builtins.open(file, mode, *args, **kwargs)
+
+    def _track_open(self, file, inside):
+        fp = os.path.abspath(os.fsdecode(file))
+        if fp == inside:
+            return
+        self._add_dep(fp, inside)
+        if fp not in self.mods:
+            # source modules keep their own stat
+            self.cache.modstat[fp] = self.cache.filestat.stat(fp)
+
     def _dep_reset(self, filename):
         """removes filename from dependency tracking"""
         x = self._deps.pop(filename, None)
@@ -89,6 +248,53 @@ class FakeModuleRegistry:
         # TODO: undo function
 
 
+    def _bind(self, mod, g, name, attr):
+        # live binding of g[name] to mod.attr
+        mod = proxy.unwrap(mod)
+        if not isinstance(mod, fmods.FakeModuleType):
+            return
+        source = mod.__file__
+        obj = mod.__dict__.get(attr, _missing)
+        if source is None or obj is _missing:
+            return
+        if isinstance(obj, fmods.FakeModuleType):
+            return  # proxies are live already
+        key = (id(g), name, attr)
+        self._bindings[source][key] = [g, name, attr, obj]
+        self._bound[id(g)].add(source)
+
+    def _unbind(self, g):
+        # drop the live bindings into g, e.g. before its module re-executes
+        for source in self._bound.pop(id(g), ()):
+            bindings = self._bindings.get(source, None)
+            if not bindings:
+                continue
+            for key in [k for k in bindings if k[0] == id(g)]:
+                del bindings[key]
+            if not bindings:
+                del self._bindings[source]
+
+    def _bind_live(self, mod, g, inside, level, name, fromlist):
+        # bind the names a `from ... import` of a __fakelive__ module
+        # assigned, including `as` targets
+        bound = self._livenames.get(inside, {}).get((level, name), {})
+        for attr in fromlist:
+            for n in bound.get(attr, (attr,)):
+                self._bind(mod, g, n, attr)
+
+    def _rebind(self, filename, d):
+        bindings = self._bindings.get(filename, None)
+        if not bindings:
+            return
+        for b in bindings.values():
+            g, name, attr, old = b
+            new = d.get(attr, _missing)
+            if new is _missing or new is old:
+                continue
+            if g.get(name, _missing) is old:
+                g[name] = new
+            b[3] = new
+
     def _create_module(self, filename):
         # only call from ._factory
         # always creates a module
@@ -107,7 +313,7 @@ class FakeModuleRegistry:
         d = mod.__dict__
 
         browse = False
-        if os.path.isfile(filename):
+        if self.fs.isfile(filename):
             file = filename
             path = [os.path.split(filename)[0]]
             if os.path.split(file)[1] == '__init__.py':
@@ -123,7 +329,7 @@ class FakeModuleRegistry:
         d['__name__'] = '%s.at("%s")' % (self._toplevel_name, filename)
         d['__fakename__'] = d['__name__']  # used by FakeModuleType repr
         d['__file__'] = file
-        d['__builtins__'] = self.builtins
+        d['__builtins__'] = self._builtins
         d['__path__'] = path
 
         d['__fullpath__'] = filename
@@ -131,16 +337,45 @@ class FakeModuleRegistry:
         d['__fakebrowse__'] = browse
         d['__fakeregistry__'] = self
 
-        # TODO: __spec__ and __loader__ for importlib.reload support
+        # importable by name through the finder, e.g. for pickle
+        loader = self.finder.at_loader
+        d['__loader__'] = loader
+        d['__spec__'] = importlib.machinery.ModuleSpec(
+            d['__name__'], loader, origin=filename)
 
         return mod
 
+    def _is_data(self, filename):
+        return os.path.splitext(filename)[1] in self.loaders
+
+    def _exec_data(self, filename, mod):
+        # data files are parsed into a fresh namespace
+        loader = self.loaders[os.path.splitext(filename)[1]]
+        d = mod.__dict__
+        if filename in self._hard_reset:
+            if filename not in self._hard_reset_always:
+                self._hard_reset.discard(filename)
+            d.clear()
+        elif not getattr(loader, 'keep_namespace', False):
+            d.clear()
+        self._populate_module(mod, filename)
+        d['__fakeload__'] = None
+        loader(self, filename, mod)
+        d['__fakeload__'] = utils.now()
+        self._rebind(filename, d)
+        return mod
+
     def _exec_module(self, filename, mod):
         # only call from _factory
-        with open(filename, 'r') as fid:
-            src = fid.read()
-
-        code = compile(src, filename, 'exec', dont_inherit=True)
+        if not filename.endswith('.py') and self._is_data(filename):
+            return self._exec_data(filename, mod)
+
+        fing, src = self.shared.source(self.fs, filename)
+        code = self._warm_code(filename)
+        if code is None:
+            code = self.fs.get_code(filename)  # precompiled, e.g. bundles
+        if code is None:
+            code = self.shared.code(filename, fing, src)
         d = mod.__dict__
 
         # opt-in tracking of objects that have been redefined
@@ -150,59 +385,292 @@ class FakeModuleRegistry:
         else:
             wd = None
 
+        if '__persist__' in src:
+            tree = ast.parse(src, filename)
+            names = persist.persist_names(tree)
+        else:
+            tree = None
+            names = ()
+
+        if '__fakelive__' in src:
+            if tree is None:
+                tree = ast.parse(src, filename)
+            self._livenames[filename] = _from_imports(tree)
+        else:
+            self._livenames.pop(filename, None)
+
         if filename in self._hard_reset:
+            keep = {}
+            if self._hard_reset_persist:
+                keep = {k: d[k] for k in names if k in d}
             d.clear()
             self._populate_module(mod, filename)
+            d.update(keep)
             if filename not in self._hard_reset_always:
                 self._hard_reset.discard(filename)
+            patched = False
+        elif self._patch_wanted(filename, d):
+            patched = hotpatch.patch_module(
+                mod, self._codes.get(filename), code)
+        else:
+            patched = False
 
-        d['__fakeload__'] = None
-        exec(code, d)
+        if not patched and self._upgrade_wanted(filename, d):
+            name = d['__name__']
+            old_classes = dict(
+                (k, v) for k, v in d.items()
+                if isinstance(v, type) and v.__module__ == name)
+        else:
+            old_classes = None
+
+        if not patched:
+            run = code
+            if names:
+                previous = self._persisted.get(filename, {})
+                current = persist.skip_persisted(tree, names, d, previous)
+                run = compile(tree, filename, 'exec', dont_inherit=True)
+
+            self._dep_reset(filename)
+            self._unbind(d)
+            d['__fakeload__'] = None
+            exec(run, d)
+
+            if names:
+                self._persisted[filename] = current
+
+            if old_classes:
+                report = hotpatch.upgrade_classes(mod, old_classes)
+                for name, reason in report:
+                    msg = '%s in %s: %s' % (name, filename, reason)
+                    warnings.warn(fmods.ClassUpgradeWarning(msg))
+        else:
+            wd = None  # nothing was redefined
+        self._codes[filename] = code
         d['__fakeload__'] = utils.now()
+        self._rebind(filename, d)
 
         stale = d.get('__stale__', None)
         if callable(stale):
+            s = {}
             if wd:
-                s = {}
                 for k, v in wd.items():
-                    if v():
+                    obj = v()
+                    # kept objects, e.g. upgraded classes, are not stale
+                    if obj is not None and obj is not d.get(k, None):
                         s[k] = v
+            if wd or patched:
                 # pass in the mod and weak dict, so
                 # __stale__ = fakemod.stalehandler could work
                 stale(mod, s)
 
         return mod
 
+    def _warm_code(self, filename):
+        entry = self._warm.pop(filename, None)
+        if entry is None:
+            return None
+        fing, code = entry
+        stat = self.cache.filestat.stats.get(filename, None)
+        if state.fingerprint(stat) != fing:
+            return None
+        return code
+
+    def _upgrade_wanted(self, filename, d):
+        return (filename in self._upgrade or
+                bool(d.get('__fakeupgrade__', False)))
+
+    def _patch_wanted(self, filename, d):
+        # patch mode needs a previous successful execution
+        if not d.get('__fakeload__'):
+            return False
+        return (filename in self._patch or
+                bool(d.get('__fakepatch__', False)))
+
     def _factory(self, fp):
+        self._gen += 1
+        self._filegen[fp] = self._gen
+
         if fp not in self.mods:
             self.mods[fp] = self._create_module(fp)
 
         mod = self.mods[fp]
 
-        if os.path.isfile(fp):
+        if self.fs.isfile(fp):
             if mod.__file__ is None:
                 self._populate_module(mod, fp)
 
-            self._dep_reset(fp)
-            self._exec_module(fp, mod)
+            self._builtins.sync()  # e.g. names added to builtins since
+            stack = getattr(self._execstate, 'stack', None)
+            if stack is None:
+                stack = self._execstate.stack = []
+            stack.append(fp)
+            try:
+                self._exec_module(fp, mod)
+            finally:
+                stack.pop()
         else:
             if mod.__file__ is not None:
-                fp = os.path.split(fp)[0]
-                self._populate_module(mod, fp)
+                self._populate_module(mod, os.path.split(fp)[0])
 
+        if self.max_bytes is not None:
+            self._measure(fp, mod)
+        self._refbase[fp] = _refcounts(mod)
         return mod
 
+    def _measure(self, fp, mod):
+        size = _nbytes(mod)
+        self._nbytes += size - self._sizes.get(fp, 0)
+        self._sizes[fp] = size
+
+    def _over_limits(self):
+        if self.max_modules is not None:
+            if len(self.mods) > self.max_modules:
+                return True
+        if self.max_bytes is not None:
+            if self._nbytes > self.max_bytes:
+                return True
+        if self.max_idle is not None and self._access:
+            oldest = next(iter(self._access.values()))
+            if time.monotonic() - oldest > self.max_idle:
+                return True
+        return False
+
+    def evict(self):
+        """Drop least recently used modules beyond `max_modules`,
+           `max_bytes` or `max_idle`. Modules referenced outside of
+           the registry are kept, as are modules whose functions,
+           classes or instances gained references since they
+           executed. Returns the evicted filenames."""
+        evicted = []
+        with self._modlock:
+            if self.max_bytes is not None:
+                for fp, mod in self.mods.items():
+                    if fp not in self._sizes:
+                        self._measure(fp, mod)
+
+            if len(self._access) < len(self.mods):
+                # loaded before a limit was set, treat as oldest
+                for fp in self.mods:
+                    if fp not in self._access:
+                        self._access[fp] = 0
+                        self._access.move_to_end(fp, last=False)
+
+            now = time.monotonic()
+            skipped = 0
+            for fp, last in list(self._access.items()):
+                over = ((self.max_modules is not None and
+                         len(self.mods) > self.max_modules) or
+                        (self.max_bytes is not None and
+                         self._nbytes > self.max_bytes))
+                idle = (self.max_idle is not None and
+                        now - last > self.max_idle)
+                if not (over or idle):
+                    break  # the rest were used more recently
+
+                if fp not in self.mods:
+                    del self._access[fp]  # failed to load
+                    continue
+                if fp in self._active or self._in_use(fp):
+                    skipped += 1
+                    if skipped >= _EVICT_SCAN:
+                        break  # bound the work of each load
+                    continue
+                self._evict(fp)
+                evicted.append(fp)
+        return evicted
+
+    def _published(self, mod):
+        # every file the module depends on is in the stat table, so an
+        # edit of any of them moves the table's generation; a missing
+        # file counts if its directory is published
+        d = mod.__dict__
+        fp = d['__file__']
+        if fp is None:
+            fp = os.path.join(d['__path__'][0], '__init__.py')
+        table = self._table
+        files = cache.deep_check_list(fp, self._deps)
+        files.add(fp)
+        for f in files:
+            if table.get(f) is None:
+                if (self.fs.exists(f) or
+                        table.get(os.path.dirname(f)) is None):
+                    return False
+        return True
+
+    def _in_use(self, fp):
+        # The module is held by self.mods and the getrefcount argument
+        # only, and none of its objects gained a reference since it
+        # executed, e.g. an instance of one of its classes. Functions
+        # keep the namespace alive through __globals__.
+        mod = self.mods[fp]
+        if sys.getrefcount(mod) > 3:  # also the local name
+            return True
+        base = self._refbase.get(fp, {})
+        for k, (i, n) in _refcounts(mod).items():
+            b = base.get(k, None)
+            if b is not None and b[0] == i and n > b[1]:
+                return True
+        return False
+
+    def _evict(self, fp):
+        # the dependency graph, stats and live bindings to its names
+        # are kept, so the module is rebuilt transparently on next
+        # access; bindings into its namespace go with it
+        mod = self.mods.pop(fp, None)
+        if mod is not None:
+            self._unbind(mod.__dict__)
+        self._access.pop(fp, None)
+        self._codes.pop(fp, None)
+        self._persisted.pop(fp, None)
+        self._nbytes -= self._sizes.pop(fp, 0)
+        self._refbase.pop(fp, None)
+        invalid = getattr(self.cache, 'cache_invalid', None)
+        if invalid is not None:
+            invalid.pop(fp, None)
+        self._gen += 1
+        self.evictions += 1
+
     def _import(self, name, gb, lc, fromlist, level=0):
         if '__fakeregistry__' not in gb:
             return self._orig_import(name, gb, lc, fromlist, level)
 
         if self.log is not None:
-            log.append(('_import', repr((name, fromlist, level))))
+            self.log.append(('_import', repr((name, fromlist, level))))
+
+        inside = gb['__fullpath__']
+        assert(inside is not None)
+        use_proxy = gb.get('__fakeproxy__', True)
+
+        # Resolution is memoized until any module is rebuilt.
+        # A proxy result reloads lazily by itself, a plain module
+        # result still goes through the cache check.
+        key = (inside, level, name,
+               tuple(fromlist) if fromlist else (), use_proxy)
+        entry = self._impcache.get(key)
+        if entry is not None and entry[0] == self._gen:
+            if use_proxy:
+                return entry[1]
+            return self._load_file(entry[1])
 
-        inside = file = gb['__fullpath__']
-        assert(file is not None)
+        mod = self._resolve_import(inside, name, fromlist, level)
 
-        p = utils.path_to_parts(file)
+        if fromlist and gb.get('__fakelive__', False):
+            if '*' in fromlist:
+                fromlist = getattr(mod, '__all__', None)
+                if fromlist is None:
+                    fromlist = [i for i in dir(mod) if i[0] != '_']
+            self._bind_live(mod, gb, inside, level, name, fromlist)
+
+        if use_proxy:
+            result = proxy.wrap(mod, inside=inside)
+            self._impcache[key] = (self._gen, result)
+        else:
+            result = mod
+            self._impcache[key] = (self._gen, mod.__fullpath__)
+        return result
+
+    def _resolve_import(self, inside, name, fromlist, level):
+        p = utils.path_to_parts(inside)
         file = utils.parts_to_path(p[:-level])
         mod = self._load_file(file)
 
@@ -231,11 +699,7 @@ class FakeModuleRegistry:
                     if fullpath:
                         self._add_dep(fullpath, inside)
 
-        use_proxy = gb.get('__fakeproxy__', True)
-        if use_proxy:
-            return proxy.wrap(mod, inside=inside)
-        else:
-            return mod
+        return mod
 
     def _get_mod(self, d, name):
 
@@ -246,19 +710,23 @@ class FakeModuleRegistry:
 
         base_py = base + '.py'
 
-        if os.path.isfile(base_py):
+        if self.fs.isfile(base_py):
             mod = self._load_file(base_py)
 
-        elif os.path.isdir(base):
+        elif self.fs.isdir(base):
             base_init = os.path.join(base, '__init__.py')
-            if os.path.isfile(base_init):
+            if self.fs.isfile(base_init):
                 mod = self._load_file(base_init)
             else:
                 mod = self._load_file(base)
-        elif os.path.isfile(base):
+        elif self.fs.isfile(base):
             mod = self._load_file(base)
         else:
             mod = None
+            for ext in self.loaders:
+                if self.fs.isfile(base + ext):
+                    mod = self._load_file(base + ext)
+                    break
 
         if mod:
             inside = d['__file__']
@@ -272,18 +740,21 @@ class FakeModuleRegistry:
     def _dir_mod(self, d):
         fp = d['__file__']
         if fp:
-            if os.path.isfile(fp):
+            if self.fs.isfile(fp):
                 fp = os.path.split(fp)[0]
         else:
             fp = d['__path__'][0]
 
         r = set(d.keys())
-        for n in os.listdir(fp):
+        for n in self.fs.listdir(fp):
             # is it a file?
             dut = os.path.join(fp, n)
-            if os.path.isfile(dut):
+            if self.fs.isfile(dut):
                 if n[-3:] != '.py':
-                    continue
+                    root, ext = os.path.splitext(n)
+                    if ext not in self.loaders:
+                        continue
+                    n = root
 
             n = utils.fs_name_to_attr(n)
             if n:
@@ -298,7 +769,7 @@ class FakeModuleRegistry:
     def _load_file(self, file):
         with self._modlock:
             # file is abspath at this point
-            if not file.endswith('.py'):
+            if not file.endswith('.py') and not self._is_data(file):
                 # assuming directory
                 file = os.path.join(file, '__init__.py')
 
@@ -314,6 +785,15 @@ class FakeModuleRegistry:
             finally:
                 self._active.discard(file)
 
+            if (self.max_modules is not None or
+                    self.max_bytes is not None or
+                    self.max_idle is not None):
+                # access times are only kept while a limit is set
+                self._access[file] = time.monotonic()
+                self._access.move_to_end(file)
+                if self._over_limits():
+                    self.evict()
+
             if self.log is not None:
                 self.log.append(('stop', file, from_cache))
             return mod
@@ -322,9 +802,97 @@ class FakeModuleRegistry:
     # API
     #------
 
+    def preload(self, paths, freeze=False):
+        """Load every module and data file under `paths`, e.g. before
+           forking workers that then share the code copy-on-write.
+           Returns {filename: exception} for files that failed to load.
+
+           With `freeze`, gc.freeze() moves every object of the process
+           out of the garbage collector's reach, so collections in the
+           workers do not touch their pages. Only use it right before
+           forking: frozen cycles, e.g. of evicted modules, are never
+           collected until gc.unfreeze() is called.
+
+           The registry lock is reset in a forked child. Watcher
+           threads are not restarted there; a shm.Publisher keeps
+           publishing from the parent.
+        """
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        errors = {}
+        for p in paths:
+            fp = utils.expand_path(os.fsdecode(p))
+            for file in self._preload_walk(fp):
+                try:
+                    self._load_file(file)
+                except Exception as e:
+                    errors[file] = e
+        if freeze and hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        return errors
+
+    def _preload_walk(self, fp):
+        fs = self.fs
+        if fs.isfile(fp):
+            if fp.endswith('.py') or self._is_data(fp):
+                yield fp
+            return
+        if not fs.isdir(fp):
+            raise ValueError('not found %r' % fp)
+        yield fp  # the package or namespace itself
+        for n in sorted(fs.listdir(fp)):
+            if n.startswith('.') or n == '__pycache__' or n == '__init__.py':
+                continue
+            child = os.path.join(fp, n)
+            for f in self._preload_walk(child):
+                yield f
+
+    def save_state(self, path):
+        """Save the dependency graph, file fingerprints and compiled
+           code to `path`, for `load_state` in a later process."""
+        with self._modlock:
+            state.save(self, path)
+
+    def load_state(self, path):
+        """Restore a snapshot from `save_state`, before loading modules.
+
+           Returns the set of files that changed or disappeared since the
+           snapshot, or None if it could not be used.
+        """
+        with self._modlock:
+            return state.load(self, path)
+
+    def mount(self, path, fs=None):
+        """Serve the directory `path` from the filesystem `fs`.
+
+           By default, `path` is a bundle file, see bundle.py.
+        """
+        fp = utils.expand_path(path)
+        if isinstance(self.fs, vfs.MountFS):
+            mounts = self.fs
+        else:
+            mounts = vfs.MountFS(self.fs)
+        if fs is None:
+            fs = bundle.ArchiveFS(fp, mounts.base)
+        mounts.mount(fp, fs)
+        self.fs = mounts
+        if isinstance(fs, bundle.ArchiveFS):
+            # the relative imports found at build time, so dependents
+            # are known before the modules of the bundle execute
+            with self._modlock:
+                for file in fs.files():
+                    for dep in fs.deps(file):
+                        self._add_dep(dep, file)
+        return fs
+
     def at(self, fp, inside='__file__'):
         fp = utils.expand_path(fp)
-        if os.path.exists(fp):
+        if fp.endswith(bundle.EXTENSION) and not self.fs.isdir(fp):
+            if self.fs.isfile(fp):
+                self.mount(fp)
+
+        if self.fs.exists(fp):
             s = self._load_file(fp)
         else:
             raise ValueError('not found %r' % fp)
@@ -336,6 +904,21 @@ class FakeModuleRegistry:
         s = proxy.wrap(s, inside)
         return s
 
+    def aat(self, fp, inside='__file__'):
+        """Awaitable `at`, file I/O and compile run in an executor"""
+        from . import aio
+        return aio.run(self.at, fp, inside)
+
+    def areload(self, filename_or_mod, inside='<reload>'):
+        """Awaitable `reload`"""
+        from . import aio
+        return aio.run(self.reload, filename_or_mod, inside)
+
+    def watch(self, interval=0.5, reload=True):
+        """Async iterator of aio.ReloadEvent for changed files"""
+        from . import aio
+        return aio.watch(self, interval, reload)
+
     def up(self, __file__):
         f = utils.expand_path(__file__)
         head, tail = os.path.split(f)
@@ -364,7 +947,7 @@ class FakeModuleRegistry:
             filename = filename_or_mod
 
         fp = utils.expand_path(filename)
-        if not fp.endswith('.py'):
+        if not fp.endswith('.py') and not self._is_data(fp):
             fp = os.path.join(fp, '__init__.py')
         if fp not in self.mods:
             raise ValueError('file not loaded: %r' % filename_or_mod)
@@ -376,7 +959,7 @@ class FakeModuleRegistry:
 
         return mod
 
-    def imp(self, modname, fromlist=None, globals=None):
+    def imp(self, modname, fromlist=None, globals=None, live=False):
         if globals is None:
             raise TypeError('globals must be provided')
 
@@ -443,7 +1026,11 @@ class FakeModuleRegistry:
                 else:
                     src = dst = n
 
-                update_dict[dst.strip()] = getattr(mod, src.strip())
+                src = src.strip()
+                dst = dst.strip()
+                update_dict[dst] = getattr(mod, src)
+                if live:
+                    self._bind(mod, globals, dst, src)
 
         # Do the update atomically, so that we don't have a partial
         # update to globals in case there was an error earlier.
@@ -0,0 +1,316 @@
+"""
+shm
+
+Change detection shared by several processes.
+
+One process publishes a generation number for each file of a tree in
+shared memory:
+
+    table = relmod.shm.SharedStatTable(create=True)
+    pub = relmod.shm.Publisher(table, ['./lib'])
+    pub.start()
+
+Workers read those numbers instead of calling `os.stat`:
+
+    relmod.shm.attach(relmod._default, table.name)
+
+A file's generation changes whenever the publisher sees its stat
+change, so every worker notices an edit at the same scan, for the cost
+of a memory read. Files the publisher does not cover are stat'ed as
+usual. The table also holds the latest generation of all files, so a
+module proxy whose files are all covered skips the check entirely
+while it is unchanged.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import os
+import stat
+import struct
+import hashlib
+import threading
+from multiprocessing import shared_memory
+
+from .cache import FileStat, _blank_stat
+from . import vfs
+
+__all__ = ['SharedStatTable', 'SharedFileStat', 'Publisher', 'attach']
+
+_MAGIC = b'RELMODS2'
+_header = struct.Struct('<8sQQ')  # magic, number of slots, generation
+_slot = struct.Struct('<QQ')     # key, generation
+_gen = struct.Struct('<Q')
+
+MISSING = 0  # generation of a file that does not exist
+
+_attach_lock = threading.Lock()
+
+
+def _key(path):
+    h = hashlib.blake2b(path.encode('utf8', 'surrogateescape'),
+                        digest_size=8).digest()
+    return int.from_bytes(h, 'little') or 1  # 0 marks an empty slot
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    # Only the creator may unlink the segment, so do not let the
+    # resource tracker register it for this process as well.
+    from multiprocessing import resource_tracker
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedStatTable:
+    """Open addressing table of path key -> generation.
+
+       There is a single writer. A slot is never moved or freed, so a
+       reader remembers where it found a path.
+    """
+
+    def __init__(self, name=None, create=False, slots=65536):
+        if create:
+            size = _header.size + slots * _slot.size
+            self.shm = shared_memory.SharedMemory(name, create=True,
+                                                  size=size)
+            self.buf = self.shm.buf
+            _header.pack_into(self.buf, 0, _MAGIC, slots, 0)
+        else:
+            self.shm = _attach(name)
+            self.buf = self.shm.buf
+            magic, slots, gen = _header.unpack_from(self.buf, 0)
+            if magic != _MAGIC:
+                raise ValueError('not a stat table %r' % name)
+        self._words = self.buf[:_header.size].cast('Q')
+        self.owner = create
+        self.slots = slots
+        self._where = {}  # path -> (key, offset)
+        self.count = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def generation(self):
+        """The latest generation published for any path"""
+        return self._words[2]
+
+    def _set_generation(self, gen):
+        self._words[2] = gen
+
+    def _offset(self, key, insert=False):
+        buf = self.buf
+        i = key % self.slots
+        for n in range(self.slots):
+            offset = _header.size + i * _slot.size
+            k = _gen.unpack_from(buf, offset)[0]
+            if k == key:
+                return offset
+            if k == 0:
+                return offset if insert else None
+            i = (i + 1) % self.slots
+        return None
+
+    def get(self, path):
+        """Generation of path, None if not published"""
+        where = self._where.get(path, None)
+        if where is None:
+            key = _key(path)
+            offset = self._offset(key)
+            if offset is None:
+                return None
+            self._where[path] = where = (key, offset)
+        return _gen.unpack_from(self.buf, where[1] + 8)[0]
+
+    def set(self, path, gen):
+        where = self._where.get(path, None)
+        if where is None:
+            key = _key(path)
+            offset = self._offset(key, insert=True)
+            if offset is None:
+                raise MemoryError('stat table is full')
+            self._where[path] = where = (key, offset)
+        key, offset = where
+        # the generation is written before the key, so a reader that
+        # finds the key always finds its generation
+        _gen.pack_into(self.buf, offset + 8, gen)
+        if _gen.unpack_from(self.buf, offset)[0] != key:
+            _gen.pack_into(self.buf, offset, key)
+            self.count += 1
+
+    def __del__(self):
+        # the view must go before the segment is closed
+        words = getattr(self, '_words', None)
+        if words is not None:
+            words.release()
+
+    def close(self):
+        self._words.release()
+        self.buf = None
+        self._where.clear()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _stat_for(gen):
+    # the generation stands in for the modification time
+    return os.stat_result((0o100444, 0, 0, 1, 0, 0, 0, gen, gen, gen),
+                          {'st_mtime_ns': gen})
+
+
+class SharedFileStat(FileStat):
+    """FileStat reading published generations, see `attach`"""
+
+    def __init__(self, table, fs=None):
+        FileStat.__init__(self, fs)
+        self.table = table
+
+    def stat(self, filename):
+        filename = os.path.abspath(filename)
+        if self.inhibit:
+            return self.stats.get(filename, _blank_stat)
+
+        gen = self.table.get(filename)
+        if gen is None:
+            return FileStat.stat(self, filename)
+        if gen == MISSING:
+            stat = _blank_stat
+        else:
+            stat = _stat_for(gen)
+        self.stats[filename] = stat
+        return stat
+
+
+def attach(registry, name):
+    """Use the stat table `name` for the change checks of registry.
+
+       Modules already loaded, e.g. preloaded before a fork, are kept
+       if their file did not change since they were loaded.
+    """
+    table = SharedStatTable(name)
+    filestat = SharedFileStat(table, registry.fs)
+    with registry._modlock:
+        modstat = registry.cache.modstat
+        for fp, loaded in list(modstat.items()):
+            gen = table.get(fp)
+            if gen is None or gen == MISSING:
+                continue
+            try:
+                st = registry.fs.stat(fp)
+            except OSError:
+                st = _blank_stat
+            if (st.st_mtime_ns, st.st_size) == (loaded.st_mtime_ns,
+                                                loaded.st_size):
+                # the stat at load time, in terms of generations
+                modstat[fp] = filestat.stats[fp] = _stat_for(gen)
+            else:
+                modstat[fp] = _blank_stat  # changed since it was loaded
+        registry.cache.filestat = filestat
+        registry._table = table  # also validates proxies, see proxy.py
+    return table
+
+
+class Publisher:
+    """Scan the trees under `paths` and publish file generations.
+
+       `scan` runs one pass, `start` runs it every `interval` seconds
+       in a daemon thread. A forked child does not inherit the thread;
+       the parent keeps publishing for it.
+    """
+
+    def __init__(self, table, paths, interval=0.5, fs=None):
+        if isinstance(paths, (str, os.PathLike)):
+            paths = [paths]
+        self.table = table
+        self.paths = [os.path.abspath(os.fsdecode(p)) for p in paths]
+        self.interval = interval
+        self.fs = vfs.LocalFS() if fs is None else fs
+        self.generation = 0
+        self._seen = {}  # path -> (mtime_ns, size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _walk(self, fp):
+        # (path, fingerprint) of fp and everything below it. The
+        # fingerprint of a directory is its listing, so a file that
+        # appears in it, e.g. an __init__.py, is a change as well.
+        fs = self.fs
+        try:
+            names = sorted(fs.listdir(fp))
+        except OSError:
+            return
+        yield fp, ('dir', hash(tuple(names)))
+        for n in names:
+            if n.startswith('.') or n == '__pycache__':
+                continue
+            p = os.path.join(fp, n)
+            try:
+                st = fs.stat(p)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                for f in self._walk(p):
+                    yield f
+            else:
+                yield p, (st.st_mtime_ns, st.st_size)
+
+    def scan(self):
+        """Publish the files that changed, returns their paths"""
+        changed = []
+        found = set()
+        last = self.generation
+        for root in self.paths:
+            for path, fing in self._walk(root):
+                found.add(path)
+                if self._seen.get(path, None) != fing:
+                    self._seen[path] = fing
+                    self.generation += 1
+                    self.table.set(path, self.generation)
+                    if fing[0] != 'dir':
+                        changed.append(path)
+
+        for path in list(self._seen):
+            if path not in found:
+                fing = self._seen.pop(path)
+                self.generation += 1
+                self.table.set(path, MISSING)
+                if fing[0] != 'dir':
+                    changed.append(path)
+
+        if self.generation != last:
+            # written last, a reader seeing it finds the paths updated
+            self.table._set_generation(self.generation)
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.scan()
+
+    def start(self):
+        self.scan()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='relmod-publisher')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
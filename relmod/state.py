@@ -0,0 +1,120 @@
+"""
+state
+
+Snapshot of a registry's warm state, restored in a new process.
+
+    reg.save_state('./.relmod-state')
+    ...
+    changed = reg.load_state('./.relmod-state')
+
+The snapshot holds the dependency graph, the stat fingerprint of every
+tracked file, and the compiled code of each module. On restore, all
+files are stat'ed in one pass. The dependency graph is restored right
+away, and the code of unchanged modules is used the first time they
+execute instead of compiling their source again.
+
+The snapshot is marshalled, so it is only restored by the same Python
+version that saved it.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import os
+import sys
+import marshal
+import tempfile
+
+FORMAT = 1
+
+
+def fingerprint(stat):
+    if stat is None or not stat.st_mtime:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def save(reg, path):
+    files = {}  # filename -> fingerprint
+    for fp, stat in reg.cache.modstat.items():
+        fing = fingerprint(stat)
+        if fing is not None:
+            files[fp] = fing
+
+    codes = {}
+    for fp, code in reg._codes.items():
+        if fp in files:
+            codes[fp] = code
+
+    deps = {}
+    for inside, d in reg._deps.items():
+        d = dict((k, v) for k, v in d.items() if k in files)
+        if d:
+            deps[inside] = d
+
+    state = {
+        'format': FORMAT,
+        'cache_tag': sys.implementation.cache_tag,
+        'files': files,
+        'codes': codes,
+        'deps': deps,
+    }
+
+    path = os.path.abspath(os.path.expanduser(path))
+    folder = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fid:
+            marshal.dump(state, fid)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def load(reg, path):
+    path = os.path.abspath(os.path.expanduser(path))
+    try:
+        with open(path, 'rb') as fid:
+            state = marshal.load(fid)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None  # missing or from another Python
+
+    if (not isinstance(state, dict) or
+            state.get('format') != FORMAT or
+            state.get('cache_tag') != sys.implementation.cache_tag):
+        return None
+
+    # one stat pass over every file of the snapshot
+    filestat = reg.cache.filestat
+    changed = set()
+    gone = set()
+    for fp, fing in state['files'].items():
+        now = fingerprint(filestat.stat(fp))
+        if now is None:
+            gone.add(fp)
+        elif tuple(fing) != now:
+            changed.add(fp)
+
+    for inside, d in state['deps'].items():
+        if inside in gone:
+            continue
+        for file, count in d.items():
+            if file in gone:
+                continue
+            reg._deps[inside][file] += count
+            reg._revdeps[file][inside] += count
+
+    for fp, code in state['codes'].items():
+        if fp not in changed and fp not in gone:
+            reg._warm[fp] = (tuple(state['files'][fp]), code)
+
+    return changed | gone
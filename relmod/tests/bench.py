@@ -0,0 +1,228 @@
+"""
+bench
+
+Benchmarks, run with
+
+    python -m relmod.tests.bench [name ...]
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import relmod
+from relmod import shm
+from relmod.tests import tkfs
+
+import os
+import sys
+import gc
+import json
+import time
+import shutil
+import resource
+import tempfile
+
+
+def _make_tree(base, n_modules=200, n_funcs=20):
+    kf = tkfs.TinyKeyFS(base)
+    for i in range(n_modules):
+        lines = ['from . import m%i' % (i // 2) if i else '',
+                 'TABLE = [%r * j for j in range(200)]' % ('x' * 10)]
+        for j in range(n_funcs):
+            lines.append('def f%i(x):\n    return x + %i\n' % (j, j))
+        kf['pkg/m%i.py' % i] = '\n'.join(lines)
+    kf['pkg/__init__.py'] = ''
+    return kf.path('pkg')
+
+
+def _private_kb():
+    # memory not shared with the parent
+    try:
+        with open('/proc/self/smaps_rollup') as fid:
+            total = 0
+            for line in fid:
+                if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                    total += int(line.split()[1])
+            return total
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(reg, tree, wfd):
+    t0 = time.perf_counter()
+    errors = reg.preload(tree, freeze=False)
+    elapsed = time.perf_counter() - t0
+    res = {'startup': elapsed, 'private_kb': _private_kb(),
+           'errors': len(errors)}
+    os.write(wfd, json.dumps(res).encode('utf8'))
+    os.close(wfd)
+
+
+def bench_fork(workers=4, n_modules=200):
+    """Worker startup and private memory, with and without preload"""
+    if not hasattr(os, 'fork'):
+        print('fork not available')
+        return
+
+    base = tempfile.mkdtemp()
+    try:
+        tree = _make_tree(base, n_modules)
+        for preload in (False, True):
+            reg = relmod.registry.FakeModuleRegistry()
+            if preload:
+                reg.preload(tree, freeze=True)
+
+            results = []
+            for w in range(workers):
+                rfd, wfd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(rfd)
+                    try:
+                        _worker(reg, tree, wfd)
+                    finally:
+                        os._exit(0)
+                os.close(wfd)
+                with os.fdopen(rfd, 'rb') as fid:
+                    results.append(json.loads(fid.read().decode('utf8')))
+                os.waitpid(pid, 0)
+
+            startup = sum(r['startup'] for r in results) / workers
+            private = sum(r['private_kb'] for r in results) / workers
+            print('preload=%-5s  %i workers x %i modules:  '
+                  'startup %8.2f ms  private %8.0f kB' %
+                  (preload, workers, n_modules, startup * 1e3, private))
+            reg.finder._remove_meta_path()
+            if preload and hasattr(gc, 'unfreeze'):
+                gc.unfreeze()
+    finally:
+        shutil.rmtree(base)
+
+
+def bench_registry(repeat=5, n_modules=200):
+    """Loading a tree in a new registry, cold and warm shared cache"""
+    base = tempfile.mkdtemp()
+    shared = relmod.cache.shared
+    try:
+        tree = _make_tree(base, n_modules)
+        for warm, ttl in ((False, 0), (True, 0), (True, 1.0)):
+            shared.stat_ttl = ttl
+            best = None
+            for r in range(repeat):
+                if not warm:
+                    shared.clear()
+                t0 = time.perf_counter()
+                reg = relmod.registry.FakeModuleRegistry()
+                errors = reg.preload(tree, freeze=False)
+                elapsed = time.perf_counter() - t0
+                reg.finder._remove_meta_path()
+                assert not errors, errors
+                best = elapsed if best is None else min(best, elapsed)
+            print('shared cache %-4s stat_ttl=%-3s  %i modules:  %8.2f ms' %
+                  ('warm' if warm else 'cold', ttl, n_modules, best * 1e3))
+    finally:
+        shared.stat_ttl = 0
+        shutil.rmtree(base)
+
+
+def bench_builtins(n=200000, repeat=5):
+    """Builtin name lookup inside a fake module and a plain module"""
+    src = '''if 1:
+    def f(n):
+        for i in range(n):
+            len; abs; min; max; isinstance; print; open
+    '''
+    base = tempfile.mkdtemp()
+    try:
+        kf = tkfs.TinyKeyFS(base)
+        kf['lookup.py'] = src
+        reg = relmod.registry.FakeModuleRegistry()
+        fake = relmod.unwrap(reg.at(kf.path('lookup.py'))).f
+        reg.finder._remove_meta_path()
+
+        g = {'__name__': 'plain'}
+        exec(compile(src, kf.path('lookup.py'), 'exec'), g)
+        plain = g['f']
+
+        for name, f in (('plain module', plain), ('fake module', fake)):
+            best = min(_timed(f, n) for r in range(repeat))
+            print('%-12s  7 builtins x %i:  %6.1f ns per lookup' %
+                  (name, n, best / (7 * n) * 1e9))
+    finally:
+        shutil.rmtree(base)
+
+
+def bench_proxy(n=20000, repeat=5):
+    """Attribute read through a module proxy, and of a plain module"""
+    base = tempfile.mkdtemp()
+    try:
+        kf = tkfs.TinyKeyFS(base)
+        kf['pkg/a.py'] = 'X = 1'
+        kf['pkg/__init__.py'] = ''
+        reg = relmod.registry.FakeModuleRegistry()
+        lib = reg.at(kf.path('pkg'))
+        a = lib.a
+        plain = type(sys)('plain')
+        plain.X = 1
+        reg.finder._remove_meta_path()
+
+        def run(name, g, expr):
+            loop = compile('for i in range(%i):\n    %s' % (n, expr),
+                           name, 'exec')
+            best = min(_timed(exec, loop, g) for r in range(repeat))
+            print('%-24s  %8.1f ns' % (name, best / n * 1e9))
+
+        run('plain.X', {'m': plain}, 'm.X')
+        run('proxy.X', {'m': a}, 'm.X')
+        run('lib.a.X', {'m': lib}, 'm.a.X')
+
+        # the module is reused between checks of the files
+        reg.check_interval = 60
+        run('proxy.X, interval 60s', {'m': a}, 'm.X')
+        run('lib.a.X, interval 60s', {'m': lib}, 'm.a.X')
+        reg.check_interval = 0
+
+        # or while the stat table reports no change, see shm.py
+        table = shm.SharedStatTable(create=True, slots=64)
+        try:
+            shm.Publisher(table, base).scan()
+            attached = shm.attach(reg, table.name)
+            run('proxy.X, stat table', {'m': a}, 'm.X')
+            run('lib.a.X, stat table', {'m': lib}, 'm.a.X')
+            attached.close()
+        finally:
+            table.close()
+    finally:
+        shutil.rmtree(base)
+
+
+def _timed(f, *args):
+    t0 = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t0
+
+
+_benchmarks = {
+    'fork': bench_fork,
+    'registry': bench_registry,
+    'builtins': bench_builtins,
+    'proxy': bench_proxy,
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    names = argv or list(_benchmarks)
+    for name in names:
+        print('--', name, '--')
+        _benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -140,6 +140,25 @@ class TestFunc(unittest.TestCase):
         finally:
             sys.modules.pop('fm_main_x')
 
+    def test_install_main(self):
+        import builtins
+        files = {'main/x.py': 'X = 1',
+                 'main/y.py': 'Y = 2'}
+        self.kf.update(files)
+        orig = builtins.__import__
+        g = {'__name__': '__main__',
+             '__file__': self.kf.path('main/run.py')}
+        exec('''if 1:
+            import relmod
+            relmod.install(globals())
+            from . import x
+            from .y import Y
+            ''', g)
+        # relative imports work without replacing the process builtin
+        self.assertIs(builtins.__import__, orig)
+        self.assertEqual(g['x'].X, 1)
+        self.assertEqual(g['Y'], 2)
+
     def test_imp(self):
         files = {'main/sub/sub/a.py': '''if 1:
     import relmod; local = relmod.install(globals())
@@ -163,6 +182,58 @@ class TestFunc(unittest.TestCase):
         self.assertEqual(lib.main.sub.sub.b.x.X, 1)
         self.assertEqual(lib.main.sub.sub.b.y.Y, 2)
 
+    def test_imp_live(self):
+        files = {'x.py': 'def add(a, b): return a + b',
+                 'y.py': '''if 1:
+    __fakelive__ = True
+    from .x import add as plus
+    ''',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+
+        g = {'__file__': self.kf.path('main.py')}
+        relmod.imp('./x.py', 'add', globals=g, live=True)
+        yd = relmod.unwrap(lib.y).__dict__
+        self.assertEqual(g['add'](2, 3), 5)
+        self.assertEqual(yd['plus'](2, 3), 5)
+
+        self.kf['x.py'] = 'def add(a, b): return a * b'
+        relmod.reload(self.kf.path('x.py'))
+        self.assertEqual(g['add'](2, 3), 6)
+        self.assertEqual(yd['plus'](2, 3), 6)
+
+        # reassigned names are left alone
+        g['add'] = None
+        relmod.reload(self.kf.path('x.py'))
+        self.assertIs(g['add'], None)
+
+    def test_imp_live_names(self):
+        files = {'cfg.py': 'LIMIT = 0',
+                 'user.py': '''if 1:
+    __fakelive__ = True
+    from .cfg import LIMIT
+    count = 0
+    ''',
+                 }
+        self.kf.update(files)
+        user = self.lib.user
+        self.assertEqual(user.LIMIT, 0)
+
+        # only the imported name follows, not other globals that
+        # happen to refer to the same object
+        self.kf['cfg.py'] = 'LIMIT = 5'
+        relmod.reload(self.kf.path('cfg.py'))
+        ud = relmod.unwrap(user).__dict__
+        self.assertEqual(ud['LIMIT'], 5)
+        self.assertEqual(ud['count'], 0)
+
+        # re-executing the importer drops its old bindings
+        cfg = self.kf.path('cfg.py')
+        self.assertEqual(len(self.reg._bindings[cfg]), 1)
+        relmod.reload(self.kf.path('user.py'))
+        self.assertEqual(len(self.reg._bindings[cfg]), 1)
+
     def test_use(self):
         files = {
             'main/sub/sub/a.py': '''if 1:
@@ -264,6 +335,184 @@ class TestFunc(unittest.TestCase):
         self.assertEqual(lib.x.yyy2.Z, 0)
 
 
+    def test_pickle(self):
+        import pickle
+        import subprocess
+        files = {'main/x.y/work.py': '''if 1:
+    class Point:
+        def __init__(self, x):
+            self.x = x
+    def double(p):
+        return p.x * 2
+    '''}
+        self.kf.update(files)
+        self.reg.finder.resolve_at = True
+        work = self.lib.main['x.y'].work
+        name = work.__name__
+        try:
+            data = pickle.dumps((work.double, work.Point(21)))
+            self.assertIn(name, sys.modules)
+            self.assertFalse([k for k in vars(relmod) if 'at("' in k])
+
+            # unpickled by loading the file again
+            del sys.modules[name]
+            f, p = pickle.loads(data)
+            self.assertIs(f, work.double)
+            self.assertEqual(f(p), 42)
+
+            # in a fresh interpreter, through the default registry
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+            out = subprocess.check_output(
+                [sys.executable, '-c',
+                 'import pickle, sys; f, p = pickle.load(sys.stdin.buffer);'
+                 'print(f(p))'],
+                input=data, env=env)
+            self.assertEqual(out.strip(), b'42')
+        finally:
+            for k in list(sys.modules):
+                if k.startswith('relmod.at("'):
+                    del sys.modules[k]
+
+    def test_pool(self):
+        files = {'work.py': '''if 1:
+    import os
+    from .scale import SCALE
+    def run(x):
+        return os.getpid(), x * SCALE
+    ''',
+                 'scale.py': 'SCALE = 2'}
+        self.kf.update(files)
+        run = relmod.unwrap(self.lib.work).run
+
+        with relmod.ProcessPool(1, roots=[self.base], interval=0) as pool:
+            pid, y = pool.submit(run, 21).result()
+            self.assertEqual(y, 42)
+
+            # the same worker picks up the edited dependency
+            self.kf['scale.py'] = 'SCALE = 100'
+            pid2, y = pool.submit(run, 21).result()
+            self.assertEqual(y, 2100)
+            self.assertEqual(pid, pid2)
+
+            self.assertEqual([y for p, y in pool.map(run, [1, 2])],
+                             [100, 200])
+
+    def test_async(self):
+        import asyncio
+        files = {'a.py': 'from .b import B',
+                 'b.py': 'B = 1',
+                 'c.py': 'C = 1'}
+        self.kf.update(files)
+
+        async def main():
+            lib = await relmod.aat(self.base)
+            a = await relmod.aat(self.kf.path('a.py'))
+            self.assertEqual(a.B, 1)
+            lib.c.C
+
+            self.kf['b.py'] = 'B = 2'
+            b = self.kf.path('b.py')
+            st = os.stat(b)
+            os.utime(b, (st.st_atime, st.st_mtime + 10))
+
+            async for event in self.reg.watch(interval=0.01):
+                break
+            self.assertEqual(event.changed, {b})
+            self.assertEqual(event.affected, {self.kf.path('a.py')})
+            self.assertEqual(relmod.unwrap(a).B, 2)
+
+            self.kf['b.py'] = 'B = 3'
+            await relmod.areload(b)
+            self.assertEqual(a.B, 3)
+
+        asyncio.run(main())
+
+    def test_data_files(self):
+        import struct
+        files = {'main/config.json': json.dumps({'rate': 0.5, 'n': 3}),
+                 'main/table.csv': 'a,b\n1,2',
+                 'main/x.py': '''if 1:
+    from . import config
+    def rate():
+        return config.rate
+    '''}
+        self.kf.update(files)
+
+        header = "{'descr': '<f8', 'fortran_order': False, 'shape': (2, 2), }"
+        header = header.ljust(118) + '\n'
+        with open(self.kf.path('main/weights.npy'), 'wb') as fid:
+            fid.write(b'\x93NUMPY\x01\x00')
+            fid.write(struct.pack('<H', len(header)))
+            fid.write(header.encode('latin1'))
+            fid.write(struct.pack('<4d', 1, 2, 3, 4))
+
+        with open(self.kf.path('main/raw.bin'), 'wb') as fid:
+            fid.write(b'\x01\x02\x03')
+
+        lib = self.lib
+        self.assertEqual(lib.main.config.rate, 0.5)
+        self.assertEqual(lib.main.config.__data__['n'], 3)
+        self.assertEqual(lib.main.table.__data__, [['a', 'b'], ['1', '2']])
+        self.assertEqual(bytes(lib.main.raw.__data__), b'\x01\x02\x03')
+        self.assertEqual(lib.main.weights.__data__.tolist(),
+                         [[1.0, 2.0], [3.0, 4.0]])
+        self.assertTrue('config' in dir(lib.main))
+        self.assertEqual(lib.main.x.rate(), 0.5)
+
+        # parsed once per change
+        cfg = relmod.unwrap(lib.main.config)
+        self.assertIs(relmod.unwrap(lib.main.config), cfg)
+
+        # dependents see the change
+        self.kf['main/config.json'] = json.dumps({'rate': 0.25})
+        self.reg.cache.invalidate(self.kf.path('main/config.json'))
+        self.assertEqual(lib.main.x.rate(), 0.25)
+        self.assertFalse(hasattr(lib.main.config, 'n'))
+
+    def test_notebook(self):
+        def notebook(*cells):
+            return json.dumps({'cells': [
+                {'cell_type': 'code', 'source': c} for c in cells] + [
+                {'cell_type': 'markdown', 'source': '# notes'}]})
+
+        cells = ['LOADS = []\nLOADS.append(1)\nbase = 10\n%matplotlib inline',
+                 'def f(x):\n    return x + base',
+                 'y = f(1)',
+                 'other = [1]']
+        self.kf['nb.ipynb'] = notebook(*cells)
+        lib = self.lib
+        nb = lib.nb
+
+        self.assertEqual(nb.y, 11)
+        loads = nb.LOADS
+        other = nb.other
+
+        # edited function reruns its cell and the cells using it
+        cells[1] = 'def f(x):\n    return x + base * 2'
+        self.kf['nb.ipynb'] = notebook(*cells)
+        self.reg.reload(nb.__file__)
+        self.assertEqual(nb.y, 21)
+        self.assertIs(nb.LOADS, loads)
+        self.assertIs(nb.other, other)
+
+        # edited first cell reruns everything depending on it
+        cells[0] = 'LOADS = []\nbase = 1'
+        self.kf['nb.ipynb'] = notebook(*cells)
+        self.reg.reload(nb.__file__)
+        self.assertEqual(nb.y, 3)
+        self.assertIsNot(nb.LOADS, loads)
+        self.assertIs(nb.other, other)
+
+        # an unchanged later cell assigning an edited name runs again
+        cells = ['x = 1', 'x = 5']
+        self.kf['nb.ipynb'] = notebook(*cells)
+        self.reg.reload(nb.__file__)
+        self.assertEqual(nb.x, 5)
+        cells[0] = 'x = 2'
+        self.kf['nb.ipynb'] = notebook(*cells)
+        self.reg.reload(nb.__file__)
+        self.assertEqual(nb.x, 5)
+
     def test_site(self):
         site = fakesite.FakeSite(self.reg)
         self.assertFalse(dir(site))  # empty
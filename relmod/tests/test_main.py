@@ -12,6 +12,8 @@ import tempfile
 import shutil
 from pprint import pprint
 import sys
+import time
+import os
 
 
 
@@ -85,6 +87,251 @@ class TestFakemod(unittest.TestCase):
 
         self.assertNotEqual(lt0, lt1)
 
+    def test_import_cache(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': '''if 1:
+                    def f():
+                        from . import b
+                        return b.B
+                    ''',
+                 'main/b.py': 'B=1',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+
+        self.assertEqual(lib.main.a.f(), 1)
+        self.assertEqual(len(self.reg._impcache), 1)
+        entry = list(self.reg._impcache.values())[0]
+
+        self.assertEqual(lib.main.a.f(), 1)
+        self.assertIs(list(self.reg._impcache.values())[0], entry)
+
+        self.kf['main/b.py'] = 'B=2'
+        self.reg.cache.invalidate(lib.main.b.__file__)
+        self.assertEqual(lib.main.a.f(), 2)
+
+    def test_open_tracking(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': '''if 1:
+                    import os
+                    here = os.path.dirname(__file__)
+                    with open(os.path.join(here, 'limit.txt')) as f:
+                        LIMIT = int(f.read())
+                    ''',
+                 'main/b.py': 'from .a import LIMIT',
+                 'main/c.py': '''if 1:
+                    import os
+                    here = os.path.dirname(__file__)
+                    with open(os.path.join(here, 'limit.txt')) as f:
+                        LIMIT = int(f.read())
+                    ''',
+                 'main/limit.txt': '1',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+        self.assertEqual(lib.main.b.LIMIT, 1)
+        self.assertEqual(lib.main.c.LIMIT, 1)
+
+        limit = self.kf.path('main/limit.txt')
+        self.assertIn(limit, self.reg._deps[lib.main.a.__file__])
+
+        self.kf['main/limit.txt'] = '2'
+        st = os.stat(limit)
+        os.utime(limit, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(lib.main.a.LIMIT, 2)
+        self.assertEqual(lib.main.b.LIMIT, 2)
+        # read by two modules, the first rebuild does not hide the edit
+        self.assertEqual(lib.main.c.LIMIT, 2)
+
+    def test_state(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': 'from .b import B',
+                 'main/b.py': 'B = 1',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+        self.assertEqual(lib.main.a.B, 1)
+        a = self.kf.path('main/a.py')
+        b = self.kf.path('main/b.py')
+
+        snapshot = self.kf.path('state')
+        self.reg.save_state(snapshot)
+
+        self.kf['main/b.py'] = 'B = 2'
+        st = os.stat(b)
+        os.utime(b, (st.st_atime, st.st_mtime + 10))
+
+        reg = relmod.registry.FakeModuleRegistry()
+        try:
+            self.assertEqual(reg.load_state(snapshot), {b})
+
+            # graph known before anything executes
+            self.assertIn(a, reg._revdeps[b])
+            self.assertIn(a, reg._warm)
+            self.assertNotIn(b, reg._warm)
+
+            lib = reg._load_file(self.base)
+            self.assertEqual(lib.main.a.B, 2)
+            self.assertNotIn(a, reg._warm)
+        finally:
+            reg.finder._remove_meta_path()
+
+        self.assertIsNone(self.reg.load_state(self.kf.path('missing')))
+
+    def test_evict(self):
+        files = dict(('m%i.py' % i, 'X = object()') for i in range(5))
+        self.kf.update(files)
+        reg = self.reg
+        lib = reg.at(self.base)
+        lib.m0.X
+        self.assertFalse(reg._access)  # not tracked without limits
+        reg.max_modules = 3
+
+        x0 = lib.m0.X
+        held = relmod.unwrap(lib.m1)
+        for i in range(2, 5):
+            getattr(lib, 'm%i' % i).X
+
+        self.assertTrue(reg.evictions > 0)
+        self.assertTrue(len(reg.mods) <= 4)  # self.lib is held too
+        self.assertNotIn(self.kf.path('m0.py'), reg.mods)
+        self.assertIn(held.__file__, reg.mods)
+
+        # rebuilt on next access
+        self.assertIsNot(lib.m0.X, x0)
+
+        reg.max_modules = None
+        reg.max_idle = 0
+        evicted = reg.evict()
+        self.assertIn(self.kf.path('m0.py'), evicted)
+        loaded = [k for k in reg.mods if k.endswith('.py') and
+                  os.path.basename(k)[0] == 'm']
+        self.assertEqual(loaded, [held.__file__])
+
+    def test_evict_objects(self):
+        files = dict(('m%i.py' % i, 'class A:\n    pass') for i in range(4))
+        self.kf.update(files)
+        reg = self.reg
+        lib = reg.at(self.base)
+        obj = lib.m0.A()
+        f = lib.m1.A
+        reg.max_modules = 2
+        for i in range(2, 4):
+            getattr(lib, 'm%i' % i).A
+
+        # objects from the namespace keep the module loaded
+        self.assertIn(self.kf.path('m0.py'), reg.mods)
+        self.assertIn(self.kf.path('m1.py'), reg.mods)
+        self.assertIsInstance(obj, lib.m0.A)
+        self.assertIs(lib.m1.A, f)
+
+        del obj, f
+        reg.evict()
+        self.assertNotIn(self.kf.path('m0.py'), reg.mods)
+
+    def test_shared(self):
+        files = {'a.py': 'from .b import B\nITEMS = []',
+                 'b.py': 'B = 1'}
+        self.kf.update(files)
+        a = self.kf.path('a.py')
+        self.assertEqual(self.lib.a.B, 1)
+
+        other = relmod.registry.FakeModuleRegistry()
+        try:
+            lib = other.at(self.base)
+            hits = other.shared.hits
+            self.assertEqual(lib.a.B, 1)
+            self.assertEqual(other.shared.hits, hits + 2)
+
+            # code is shared, namespaces are not
+            self.assertIs(other._codes[a], self.reg._codes[a])
+            lib.a.ITEMS.append(1)
+            self.assertEqual(self.lib.a.ITEMS, [])
+
+            self.kf['b.py'] = 'B = 22'
+            b = self.kf.path('b.py')
+            st = os.stat(b)
+            os.utime(b, (st.st_atime, st.st_mtime + 10))
+            self.assertEqual(lib.a.B, 22)
+            self.assertEqual(self.lib.a.B, 22)
+        finally:
+            other.finder._remove_meta_path()
+
+    def test_shared_reload(self):
+        self.kf['b.py'] = 'B = 1'
+        b = self.kf.path('b.py')
+        self.assertEqual(self.lib.b.B, 1)
+
+        # same size and mtime, only an explicit reload notices
+        st = os.stat(b)
+        self.kf['b.py'] = 'B = 2'
+        os.utime(b, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.reg.reload(b)
+        self.assertEqual(self.lib.b.B, 2)
+
+    def test_builtins(self):
+        import builtins
+        files = {'a.py': '''if 1:
+    N = len([1, 2])
+    def f():
+        return relmod_test_name
+    '''}
+        self.kf.update(files)
+        other = relmod.registry.FakeModuleRegistry()
+        other.finder._remove_meta_path()
+        self.assertIs(other.builtins, self.reg.builtins)  # not copied
+
+        # later changes to builtins are followed
+        builtins.relmod_test_name = 5
+        try:
+            a = self.lib.a
+            self.assertEqual(a.N, 2)
+            self.assertEqual(a.f(), 5)
+        finally:
+            del builtins.relmod_test_name
+        self.reg.reload(a)
+        with self.assertRaises(NameError):
+            a.f()
+
+        # one added and one removed between syncs
+        builtins.relmod_test_name = 5
+        self.reg.builtins.sync()
+        del builtins.relmod_test_name
+        builtins.relmod_test_other = 6
+        try:
+            self.reg.reload(a)
+            with self.assertRaises(NameError):
+                a.f()
+        finally:
+            del builtins.relmod_test_other
+
+    def test_preload(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': 'from .b import B',
+                 'main/b.py': 'B = 1',
+                 'main/sub/c.py': 'C = 1',
+                 'main/bad.py': '1/0',
+                 }
+        self.kf.update(files)
+        errors = self.reg.preload(self.kf.path('main'), freeze=False)
+        self.assertEqual(list(errors), [self.kf.path('main/bad.py')])
+        for f in ('main/a.py', 'main/b.py', 'main/sub/c.py'):
+            self.assertIn(self.kf.path(f), self.reg.mods)
+
+        if not hasattr(os, 'fork'):
+            return
+
+        a = self.lib.main.a
+        loaded = a.__fakeload__
+        pid = os.fork()
+        if pid == 0:
+            # child, nothing is executed again
+            ok = (self.lib.main.a.__fakeload__ == loaded and
+                  self.reg._modlock.acquire(timeout=1))
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
     def test_browse(self):
         kf = self.kf
         lib = self.lib
@@ -119,6 +366,112 @@ class TestFakemod(unittest.TestCase):
         a.__stale__ = stale
         self.reg.reload(a.__file__)
 
+    def test_patch(self):
+        src = '''if 1:
+            __fakepatch__ = True
+            LOADS = []
+            LOADS.append(1)
+            def f():
+                return %r
+            class A:
+                def m(self):
+                    return super().__repr__() and %r
+            '''
+        files = {'main/__init__.py': '',
+                 'main/a.py': src % (1, 1)}
+        self.kf.update(files)
+        a = self.lib.main.a
+
+        f = a.f
+        obj = a.A()
+        loads = a.LOADS
+        self.assertEqual(f(), 1)
+        self.assertEqual(obj.m(), 1)
+
+        # only function bodies changed, patch in place
+        self.kf['main/a.py'] = src % (2, 3)
+        self.reg.reload(a.__file__)
+        self.assertEqual(f(), 2)
+        self.assertEqual(obj.m(), 3)
+        self.assertIs(a.LOADS, loads)
+        self.assertIs(a.f, f)
+
+        # module level changed, full exec
+        self.kf['main/a.py'] = (src % (2, 3)) + 'X = 1\n'
+        self.reg.reload(a.__file__)
+        self.assertEqual(a.X, 1)
+        self.assertIsNot(a.LOADS, loads)
+        self.assertIsNot(a.f, f)
+
+    def test_upgrade(self):
+        src = '''if 1:
+            __fakeupgrade__ = True
+            class Base:
+                def m(self):
+                    return 1
+            class A(Base):
+                %s
+                def m(self):
+                    return super().m() + %r
+            x = A()
+            '''
+        files = {'main/__init__.py': '',
+                 'main/a.py': src % ('', 1)}
+        self.kf.update(files)
+        a = self.lib.main.a
+
+        A = a.A
+        obj = A()
+        self.assertEqual(obj.m(), 2)
+
+        self.kf['main/a.py'] = src % ('', 2)
+        self.reg.reload(a.__file__)
+        self.assertIs(a.A, A)
+        self.assertEqual(obj.m(), 3)
+        self.assertIsInstance(a.x, A)
+        self.assertEqual(a.x.m(), 3)
+
+        # incompatible layout is reported, not upgraded
+        self.kf['main/a.py'] = src % ('__slots__ = ()', 2)
+        with self.assertWarns(relmod.fmods.ClassUpgradeWarning):
+            self.reg.reload(a.__file__)
+        self.assertIsNot(a.A, A)
+
+    def test_persist(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': '\n'.join([
+                     "__persist__ = ['DATA']",
+                     "DATA = [object()]",
+                     "OTHER = [object()]"])}
+        self.kf.update(files)
+        a = self.lib.main.a
+        fp = a.__file__
+
+        data = a.DATA
+        other = a.OTHER
+        self.reg.reload(fp)
+        self.assertIs(a.DATA, data)
+        self.assertIsNot(a.OTHER, other)
+
+        # hard reset honors __persist__
+        self.reg._hard_reset.add(fp)
+        self.reg.reload(fp)
+        self.assertIs(a.DATA, data)
+
+        self.reg._hard_reset_persist = False
+        self.reg._hard_reset.add(fp)
+        self.reg.reload(fp)
+        self.assertIsNot(a.DATA, data)
+
+        # changed source of the assignment
+        data = a.DATA
+        self.kf['main/a.py'] = '\n'.join([
+            "__persist__ = ['DATA']",
+            "DATA = [object(), 2]"])
+        self.reg.reload(fp)
+        self.assertIsNot(a.DATA, data)
+        self.assertEqual(len(a.DATA), 2)
+
     def test_spaces(self):
         files = {'main/__init__.py': """if 1:
                 import relmod; relmod.install(globals())
@@ -179,6 +532,29 @@ class TestFakemod(unittest.TestCase):
         finally:
             sys.modules.pop('fm_showcase', None)
 
+    def test_register_spec(self):
+        import importlib.machinery
+        files = {'showcase/__init__.py': '',
+                 'showcase/x.py': 'def x(x): return x'}
+        self.kf.update(files)
+        finder = self.reg.finder
+        finder.register('fm_showcase', self.kf.path('showcase'))
+        self.assertIsNone(finder.find_spec('fm_other'))
+        self.assertIsNone(finder.find_spec('fm_other.x'))
+
+        spec = finder.find_spec('fm_showcase.x')
+        self.assertIsInstance(spec, importlib.machinery.ModuleSpec)
+        self.assertEqual(spec.parent, 'fm_showcase')
+        try:
+            import fm_showcase.x
+            self.assertEqual(fm_showcase.x.x(123), 123)
+            mod = sys.modules['fm_showcase.x']
+            self.assertEqual(mod.__spec__.origin,
+                             self.kf.path('showcase/x.py'))
+        finally:
+            sys.modules.pop('fm_showcase', None)
+            sys.modules.pop('fm_showcase.x', None)
+
 
     def test_proxy(self):
         files = {'showcase/__init__.py':'',
@@ -187,6 +563,79 @@ class TestFakemod(unittest.TestCase):
         p = self.reg.at(self.lib.showcase.__file__)
         self.assertEqual(p.x.x(123), 123)
 
+        # attributes go to the module, the proxy state stays private
+        x = p.x
+        self.assertIsInstance(x, relmod.proxy.ModuleProxy)
+        self.assertEqual(x.__name__, relmod.unwrap(x).__name__)
+        self.assertIs(x.__dict__, relmod.unwrap(x).__dict__)
+        self.assertFalse(hasattr(x, 'missing'))
+        x.y = 1
+        self.assertEqual(relmod.unwrap(x).y, 1)
+        self.assertEqual(x, p.x)
+
+        # interned and hashable
+        self.assertIs(p.x, x)
+        self.assertEqual(len({x, p.x, p}), 2)
+        self.assertEqual(hash(x), hash(relmod.proxy.ModuleProxy(
+            self.reg, relmod.unwrap(x).__file__, None)))
+
+    def test_proxy_deps(self):
+        files = {'a.py': '''if 1:
+    from . import b
+    def get():
+        return b.B
+    ''',
+                 'b.py': 'B = 1'}
+        self.kf.update(files)
+        lib = self.reg.at(self.base)
+        a, b = self.kf.path('a.py'), self.kf.path('b.py')
+        self.assertEqual(lib.a.get(), 1)
+        self.assertIn(b, self.reg._deps[a])
+
+        # an interned proxy records the dependency again after the
+        # importing module executed anew
+        self.reg.reload(a)
+        self.assertIn(b, self.reg._deps[a])
+        self.kf['b.py'] = 'B = 2'
+        st = os.stat(b)
+        os.utime(b, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(lib.a.get(), 2)
+
+    def test_proxy_interval(self):
+        self.kf.update({'a.py': 'X = 1', 'b.py': 'Y = 1'})
+        lib = self.reg.at(self.base)
+        a = self.kf.path('a.py')
+        self.reg.check_interval = 60
+        p = lib.a
+        self.assertEqual(p.X, 1)
+
+        def edit(text):
+            self.kf['a.py'] = text
+            st = os.stat(a)
+            os.utime(a, (st.st_atime, st.st_mtime + 10))
+
+        # the module is reused without checking the file
+        edit('X = 2')
+        self.assertEqual(p.X, 1)
+        self.assertIs(lib.a, p)
+
+        # until some module of the registry is rebuilt
+        self.assertEqual(lib.b.Y, 1)
+        self.assertEqual(p.X, 2)
+
+        # or the interval passed
+        self.reg.check_interval = 0.01
+        p.X
+        edit('X = 3')
+        time.sleep(0.02)
+        self.assertEqual(p.X, 3)
+
+        # the proxy does not keep its module from being evicted
+        self.reg.max_modules = 1
+        lib.b.Y
+        self.assertNotIn(a, self.reg.mods)
+        self.assertEqual(p.X, 3)
+
 
     def test_auto(self):
         self.assertIs(relmod.auto.pprint.pprint, pprint)
@@ -0,0 +1,175 @@
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import relmod
+from relmod.tests import tkfs
+
+import unittest
+import tempfile
+import shutil
+import subprocess
+import sys
+import os
+
+
+class TestMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.kf = tkfs.TinyKeyFS(self.base)
+        self.reg = relmod.registry.FakeModuleRegistry()
+        self.lib = self.reg._load_file(self.base)
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+        self.reg.finder._remove_meta_path()
+
+    def test_memo(self):
+        files = {'a.py': '''if 1:
+    import relmod
+    from .b import B
+    CALLS = []
+    @relmod.memo(maxsize=2)
+    def f(x):
+        CALLS.append(x)
+        return x + B
+    ''',
+                 'b.py': 'B = 1',
+                 }
+        self.kf.update(files)
+        a = self.lib.a
+
+        f = a.f
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f(1), 2)
+        self.assertEqual(a.CALLS, [1])
+        info = f.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+        # LRU eviction
+        f(2)
+        f(3)
+        self.assertEqual(f.cache_info().currsize, 2)
+        self.assertEqual(f.cache_info().evictions, 1)
+
+        f.cache_clear()
+        self.assertEqual(f.cache_info().currsize, 0)
+
+    def test_memo_reload(self):
+        files = {'a.py': 'def f(x): return x + 1',
+                 'b.py': 'B = 1',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+
+        # wrapped outside of the module, follows its reloads
+        f = relmod.memo(relmod.unwrap(lib.a).f)
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f(1), 2)
+
+        # unrelated reload keeps the results
+        self.reg.reload(lib.b.__file__)
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f.cache_info().invalidations, 0)
+        self.assertEqual(f.cache_info().hits, 2)
+
+        self.kf['a.py'] = 'def f(x): return x + 10'
+        self.reg.reload(lib.a.__file__)
+        self.assertEqual(f(1), 11)
+        self.assertEqual(f.cache_info().invalidations, 1)
+
+
+    def test_memory(self):
+        files = {'a.py': '''if 1:
+    from .b import B
+    SCALE = 2
+    def f(x):
+        return x * SCALE + B
+    ''',
+                 'b.py': 'B = 1',
+                 'c.py': 'C = 1',
+                 }
+        self.kf.update(files)
+        lib = self.lib
+        mem = relmod.Memory(self.kf.path('cache'))
+
+        f = mem.cache(relmod.unwrap(lib.a).f)
+        self.assertEqual(f(1), 3)
+        self.assertEqual(f(1), 3)
+        self.assertEqual(f.cache_info().hits, 1)
+
+        # a fresh wrapper, as after a restart, reads from disk
+        g = mem.cache(relmod.unwrap(lib.a).f)
+        self.assertEqual(g(1), 3)
+        self.assertEqual(g.cache_info().hits, 1)
+
+        # unrelated module does not change the fingerprint
+        self.reg.reload(lib.c.__file__)
+        self.assertEqual(f(1), 3)
+        self.assertEqual(f.cache_info().hits, 2)
+
+        # dependency source changed
+        self.kf['b.py'] = 'B = 10'
+        self.reg.reload(lib.b.__file__)
+        self.assertEqual(lib.a.B, 10)
+        self.assertEqual(f(1), 12)
+        self.assertEqual(f.cache_info().misses, 2)
+
+        # module-level constant read by the function changed
+        self.kf['a.py'] = files['a.py'].replace('SCALE = 2', 'SCALE = 3')
+        self.reg.reload(lib.a.__file__)
+        self.assertEqual(f(1), 13)
+
+        # and a dict read by the function
+        self.kf['a.py'] = files['a.py'].replace(
+            'SCALE = 2', 'P = {"scale": 4}\n    SCALE = P["scale"]'
+            ).replace('x * SCALE', 'x * P["scale"]')
+        self.reg.reload(lib.a.__file__)
+        self.assertEqual(f(1), 14)
+        self.kf['a.py'] = self.kf['a.py'].replace('4}', '5}')
+        self.reg.reload(lib.a.__file__)
+        self.assertEqual(f(1), 15)
+
+        mem.maxbytes = 0
+        f(2)
+        self.assertEqual(mem.nbytes(), 0)
+
+        mem.maxbytes = None
+        f(2)
+        self.assertTrue(mem.nbytes() > 0)
+        mem.clear()
+        self.assertEqual(mem.nbytes(), 0)
+
+    def test_fingerprint_hashseed(self):
+        # set constants must not make the fingerprint differ
+        # between interpreters
+        src = '''if 1:
+            import hashlib
+            from relmod.memo import _code_hash
+            NAMES = frozenset(['a', 'b', 'c', 'd'])
+            def f(x):
+                return x in {'w', 'x', 'y', 'z'} or x in NAMES
+            h = hashlib.sha256()
+            _code_hash(h, f.__code__, globals(), set())
+            print(h.hexdigest())
+        '''
+        found = set()
+        for seed in '123':
+            env = dict(os.environ, PYTHONHASHSEED=seed,
+                       PYTHONPATH=os.pathsep.join(sys.path))
+            out = subprocess.check_output([sys.executable, '-c', src],
+                                          env=env)
+            found.add(out.strip())
+        self.assertEqual(len(found), 1)
+
+
+def run():
+    unittest.main(__name__, verbosity=2)
+
+
+if __name__ == '__main__':
+    run()
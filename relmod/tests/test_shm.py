@@ -0,0 +1,149 @@
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import relmod
+from relmod import vfs, shm
+
+import unittest
+import os
+
+
+class TestShm(unittest.TestCase):
+
+    def setUp(self):
+        self.base = os.path.abspath(os.path.join(os.sep, 'proj'))
+        self.fs = vfs.MemoryFS()
+        self.table = shm.SharedStatTable(create=True, slots=64)
+
+    def tearDown(self):
+        self.table.close()
+
+    def path(self, key):
+        return os.path.join(self.base, key)
+
+    def test_table(self):
+        t = self.table
+        t.set('/a.py', 5)
+        self.assertEqual(t.get('/a.py'), 5)
+        self.assertIsNone(t.get('/b.py'))
+
+        # another mapping of the same segment
+        other = shm.SharedStatTable(t.name)
+        try:
+            self.assertEqual(other.get('/a.py'), 5)
+            t.set('/a.py', 6)
+            self.assertEqual(other.get('/a.py'), 6)
+        finally:
+            other.close()
+
+    def test_publish(self):
+        self.fs.write(self.path('a.py'), 'from .b import B')
+        self.fs.write(self.path('b.py'), 'B = 1')
+        pub = shm.Publisher(self.table, self.base, fs=self.fs)
+        self.assertEqual(len(pub.scan()), 2)
+        self.assertEqual(pub.scan(), [])
+
+        reg = relmod.registry.FakeModuleRegistry()
+        try:
+            reg.fs = self.fs
+            table = shm.attach(reg, self.table.name)
+            lib = reg.at(self.base)
+            self.assertEqual(lib.a.B, 1)
+
+            # not seen until published
+            self.fs.write(self.path('b.py'), 'B = 2')
+            self.assertEqual(lib.a.B, 1)
+            self.assertEqual(pub.scan(), [self.path('b.py')])
+            self.assertEqual(lib.a.B, 2)
+
+            self.fs.remove(self.path('b.py'))
+            pub.scan()
+            self.assertEqual(table.get(self.path('b.py')), shm.MISSING)
+            table.close()
+        finally:
+            reg.finder._remove_meta_path()
+
+    def test_attach_loaded(self):
+        self.fs.write(self.path('a.py'), 'from .b import B')
+        self.fs.write(self.path('b.py'), 'B = 1')
+        self.fs.write(self.path('c.py'), 'C = 1')
+        pub = shm.Publisher(self.table, self.base, fs=self.fs)
+
+        reg = relmod.registry.FakeModuleRegistry()
+        try:
+            reg.fs = self.fs
+            reg.preload(self.base, freeze=False)
+            self.fs.write(self.path('c.py'), 'C = 2')  # after the load
+            pub.scan()
+
+            # as in a forked worker, unchanged modules are kept
+            a = reg.mods[self.path('a.py')]
+            loaded = a.__fakeload__
+            table = shm.attach(reg, self.table.name)
+            lib = reg.at(self.base)
+            self.assertEqual(lib.a.B, 1)
+            self.assertEqual(lib.a.__fakeload__, loaded)
+            self.assertEqual(lib.c.C, 2)
+            table.close()
+        finally:
+            reg.finder._remove_meta_path()
+
+    def test_proxy_stamp(self):
+        self.fs.write(self.path('a.py'), 'from .b import B')
+        self.fs.write(self.path('b.py'), 'B = 1')
+        self.fs.write(os.path.join(os.sep, 'other.py'), 'O = 1')
+        pub = shm.Publisher(self.table, self.base, fs=self.fs)
+        pub.scan()
+
+        reg = relmod.registry.FakeModuleRegistry()
+        try:
+            reg.fs = self.fs
+            table = shm.attach(reg, self.table.name)
+            loads = []
+            load_file = reg._load_file
+            def counted(fp):
+                loads.append(fp)
+                return load_file(fp)
+            reg._load_file = counted
+
+            lib = reg.at(self.base)
+            a = lib.a
+            self.assertEqual(a.B, 1)
+            lib.a  # stamped after a was built
+            del loads[:]
+
+            # no file check while the table generation holds
+            self.assertEqual(a.B, 1)
+            self.assertIs(lib.a, a)
+            self.assertEqual(loads, [])
+
+            self.fs.write(self.path('b.py'), 'B = 2')
+            pub.scan()
+            self.assertEqual(a.B, 2)
+
+            # a new file in a published directory is a change too
+            self.fs.write(self.path('c.py'), 'C = 3')
+            pub.scan()
+            self.assertEqual(lib.c.C, 3)
+
+            # files outside the table are checked on every access
+            other = reg.at(os.path.join(os.sep, 'other.py'))
+            other.O
+            del loads[:]
+            other.O
+            self.assertEqual(len(loads), 1)
+            table.close()
+        finally:
+            reg.finder._remove_meta_path()
+
+
+def run():
+    unittest.main(__name__, verbosity=2)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,157 @@
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import relmod
+from relmod import vfs
+from relmod.tests import tkfs
+
+import unittest
+import tempfile
+import shutil
+import os
+
+
+class TestMemoryFS(unittest.TestCase):
+
+    def setUp(self):
+        self.base = os.path.abspath(os.path.join(os.sep, 'proj'))
+        self.fs = vfs.MemoryFS()
+        self.reg = relmod.registry.FakeModuleRegistry()
+        self.reg.fs = self.fs
+
+    def tearDown(self):
+        self.reg.finder._remove_meta_path()
+
+    def path(self, key):
+        return os.path.join(self.base, key)
+
+    def update(self, files):
+        for k, v in files.items():
+            self.fs.write(self.path(k), v)
+
+    def test_fs(self):
+        fs = self.fs
+        fs.write(self.path('a/b.py'), 'X = 1', mtime=5)
+        self.assertTrue(fs.isdir(self.path('a')))
+        self.assertTrue(fs.isfile(self.path('a/b.py')))
+        self.assertEqual(fs.listdir(self.path('a')), ['b.py'])
+        self.assertEqual(fs.stat(self.path('a/b.py')).st_mtime, 5)
+        self.assertEqual(fs.read_text(self.path('a/b.py')), 'X = 1')
+
+        fs.remove(self.path('a/b.py'))
+        self.assertFalse(fs.exists(self.path('a/b.py')))
+        with self.assertRaises(FileNotFoundError):
+            fs.stat(self.path('a/b.py'))
+
+    def test_modules(self):
+        self.update({'main/__init__.py': '',
+                     'main/a.py': 'from .b import B',
+                     'main/b.py': 'B = 1',
+                     'main/config.json': '{"rate": 2}',
+                     })
+        lib = self.reg.at(self.base)
+        self.assertEqual(lib.main.a.B, 1)
+        self.assertEqual(lib.main.config.rate, 2)
+        self.assertIn('config', dir(lib.main))
+
+        # a new mtime is seen without an explicit reload
+        self.fs.write(self.path('main/b.py'), 'B = 2')
+        self.assertEqual(lib.main.a.B, 2)
+
+        # an unchanged mtime hides the edit
+        mtime = self.fs.stat(self.path('main/b.py')).st_mtime
+        self.fs.write(self.path('main/b.py'), 'B = 3', mtime=mtime)
+        self.assertEqual(lib.main.a.B, 2)
+        self.fs.touch(self.path('main/b.py'))
+        self.assertEqual(lib.main.a.B, 3)
+
+    def test_open(self):
+        self.update({'a.py': '''if 1:
+                        with open(__file__[:-4] + 'limit.txt') as f:
+                            LIMIT = int(f.read())
+                        ''',
+                     'limit.txt': '1',
+                     })
+        lib = self.reg.at(self.base)
+        self.assertEqual(lib.a.LIMIT, 1)
+
+        self.fs.write(self.path('limit.txt'), '2')
+        self.assertEqual(lib.a.LIMIT, 2)
+
+
+class TestBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.kf = tkfs.TinyKeyFS(os.path.join(self.base, 'src'))
+        self.reg = relmod.registry.FakeModuleRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+        self.reg.finder._remove_meta_path()
+
+    def test_bundle(self):
+        files = {'main/__init__.py': '',
+                 'main/a.py': 'from .b import B',
+                 'main/b.py': 'B = 1',
+                 'main/config.json': '{"rate": 2}',
+                 'main/__pycache__/b.cpython-311.pyc': '',
+                 }
+        self.kf.update(files)
+        out = os.path.join(self.base, 'lib.relmod')
+        index = relmod.bundle.build(self.kf.base, out)
+        self.assertEqual(sorted(index['files']),
+                         ['main/__init__.py', 'main/a.py',
+                          'main/b.py', 'main/config.json'])
+        self.assertEqual(index['files']['main/a.py']['deps'],
+                         ['main/b.py'])
+
+        # the bundle does not need the tree
+        shutil.rmtree(self.kf.base)
+        lib = self.reg.at(out)
+        a = os.path.join(out, 'main', 'a.py')
+        b = os.path.join(out, 'main', 'b.py')
+        self.assertIn(a, self.reg._revdeps[b])  # from the index
+        self.assertEqual(lib.main.a.B, 1)
+        self.assertEqual(lib.main.config.rate, 2)
+        self.assertEqual(lib.main.b.__file__,
+                         os.path.join(out, 'main', 'b.py'))
+        self.assertIn('a', dir(lib.main))
+
+        # precompiled code is used
+        fs = self.reg.fs.resolve(out)
+        code = fs.get_code(lib.main.b.__file__)
+        self.assertEqual(code.co_filename, lib.main.b.__file__)
+
+        # a rebuilt bundle is noticed
+        self.kf.update(dict(files, **{'main/b.py': 'B = 2'}))
+        relmod.bundle.build(self.kf.base, out)
+        st = os.stat(out)
+        os.utime(out, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(lib.main.a.B, 2)
+
+    def test_missing_import(self):
+        self.kf.update({'a.py': 'from .nothere import X'})
+        with self.assertWarns(UserWarning):
+            relmod.bundle.build(self.kf.base,
+                                os.path.join(self.base, 'lib.relmod'))
+
+    def test_build_error(self):
+        self.kf.update({'a.py': 'def'})
+        out = os.path.join(self.base, 'lib.relmod')
+        with self.assertRaises(SyntaxError):
+            relmod.bundle.build(self.kf.base, out)
+        self.assertFalse(os.path.exists(out + '.tmp'))
+        self.assertFalse(os.path.exists(out))
+
+
+def run():
+    unittest.main(__name__, verbosity=2)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,301 @@
+"""
+vfs
+
+Filesystem backends of a registry.
+
+    fs = relmod.vfs.MemoryFS()
+    fs.write('/proj/a.py', 'X = 1')
+
+    reg = relmod.registry.FakeModuleRegistry()
+    reg.fs = fs
+    lib = reg.at('/proj')
+
+Every file the registry, its cache and the fake site look at goes
+through `registry.fs`. `LocalFS` is the default and uses the operating
+system. `MemoryFS` keeps files in a dictionary with modification times
+controlled by the caller, so tests and benchmarks need no disk I/O.
+
+A backend implements `stat`, `listdir` and `open` for reading. The
+other methods have defaults built on those three. A backend holding
+precompiled modules returns their code objects from `get_code`.
+
+`MountFS` overlays other backends on directories of a base backend,
+as `registry.mount` does for bundles, see bundle.py.
+
+"""
+
+##
+## Author:    Roger D. Serwy
+## Copyright: 2020-2022, Roger D. Serwy
+##            All rights reserved.
+## License:   BSD 2-Clause, see LICENSE file from project
+##
+
+import io
+import os
+import stat
+import errno
+import threading
+
+__all__ = ['FileSystem', 'LocalFS', 'MemoryFS', 'MountFS']
+
+
+class FileSystem:
+    """Read-only filesystem interface, paths are absolute."""
+
+    def stat(self, path):
+        """Return an os.stat_result, raise OSError if missing"""
+        raise NotImplementedError
+
+    def listdir(self, path):
+        raise NotImplementedError
+
+    def open(self, path, mode='r', *args, **kwargs):
+        raise NotImplementedError
+
+    def isfile(self, path):
+        try:
+            st = self.stat(path)
+        except OSError:
+            return False
+        return stat.S_ISREG(st.st_mode)
+
+    def isdir(self, path):
+        try:
+            st = self.stat(path)
+        except OSError:
+            return False
+        return stat.S_ISDIR(st.st_mode)
+
+    def exists(self, path):
+        try:
+            self.stat(path)
+        except OSError:
+            return False
+        return True
+
+    def read_text(self, path):
+        with self.open(path, 'r') as fid:
+            return fid.read()
+
+    def read_bytes(self, path):
+        with self.open(path, 'rb') as fid:
+            return fid.read()
+
+    def get_code(self, path):
+        """Return the compiled module code, None to compile the source"""
+        return None
+
+    def is_shared(self, path):
+        """True if path reads the same through every instance of this
+           backend, so its data may be cached across registries"""
+        return False
+
+
+class LocalFS(FileSystem):
+    """The operating system's filesystem"""
+
+    def is_shared(self, path):
+        return True
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def open(self, path, mode='r', *args, **kwargs):
+        return open(path, mode, *args, **kwargs)
+
+    isfile = staticmethod(os.path.isfile)
+    isdir = staticmethod(os.path.isdir)
+    exists = staticmethod(os.path.exists)
+
+
+def _not_found(path):
+    return FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+
+class MemoryFS(FileSystem):
+    """Files held in memory.
+
+       Each write advances a clock by one second and stamps the file
+       with it, unless `mtime` is given. Pass the same `mtime` to hide
+       an edit from the cache, as a coarse disk clock would.
+    """
+
+    def __init__(self, files=None):
+        self._lock = threading.RLock()
+        self._files = {}  # path -> (bytes, mtime)
+        self._dirs = {}   # path -> set of names
+        self.clock = 0.0
+        root = os.path.abspath(os.sep)
+        self._dirs[root] = set()
+        if files:
+            for path, data in files.items():
+                self.write(path, data)
+
+    def _tick(self):
+        self.clock += 1.0
+        return self.clock
+
+    def makedirs(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            while path not in self._dirs:
+                if path in self._files:
+                    raise FileExistsError(path)
+                self._dirs[path] = set()
+                head, tail = os.path.split(path)
+                self._dirs.setdefault(head, set()).add(tail)
+                path = head
+
+    def write(self, path, data, mtime=None):
+        path = os.path.abspath(path)
+        if isinstance(data, str):
+            data = data.encode('utf8')
+        head, tail = os.path.split(path)
+        with self._lock:
+            if path in self._dirs:
+                raise IsADirectoryError(path)
+            self.makedirs(head)
+            if mtime is None:
+                mtime = self._tick()
+            self._files[path] = (bytes(data), mtime)
+            self._dirs[head].add(tail)
+
+    def touch(self, path, mtime=None):
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._files:
+                self.write(path, b'', mtime)
+                return
+            if mtime is None:
+                mtime = self._tick()
+            self._files[path] = (self._files[path][0], mtime)
+
+    def remove(self, path):
+        path = os.path.abspath(path)
+        head, tail = os.path.split(path)
+        with self._lock:
+            if path not in self._files:
+                raise _not_found(path)
+            del self._files[path]
+            self._dirs[head].discard(tail)
+
+    def stat(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._files.get(path, None)
+            if entry is not None:
+                data, mtime = entry
+                mode = stat.S_IFREG | 0o644
+                size = len(data)
+            elif path in self._dirs:
+                mtime = 0.0
+                mode = stat.S_IFDIR | 0o755
+                size = 0
+            else:
+                raise _not_found(path)
+        ns = int(mtime * 1e9)
+        return os.stat_result(
+            (mode, 0, 0, 1, 0, 0, size, mtime, mtime, mtime),
+            {'st_atime_ns': ns, 'st_mtime_ns': ns, 'st_ctime_ns': ns})
+
+    def listdir(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            names = self._dirs.get(path, None)
+            if names is None:
+                if path in self._files:
+                    raise NotADirectoryError(path)
+                raise _not_found(path)
+            return sorted(names)
+
+    def open(self, path, mode='r', *args, **kwargs):
+        if any(c in mode for c in 'wax+'):
+            raise io.UnsupportedOperation('use MemoryFS.write')
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._files.get(path, None)
+        if entry is None:
+            if path in self._dirs:
+                raise IsADirectoryError(path)
+            raise _not_found(path)
+        fid = io.BytesIO(entry[0])
+        if 'b' in mode:
+            return fid
+        encoding = kwargs.get('encoding', None) or 'utf8'
+        newline = kwargs.get('newline', None)
+        return io.TextIOWrapper(fid, encoding, newline=newline)
+
+    def isfile(self, path):
+        return os.path.abspath(path) in self._files
+
+    def isdir(self, path):
+        return os.path.abspath(path) in self._dirs
+
+    def exists(self, path):
+        path = os.path.abspath(path)
+        return path in self._files or path in self._dirs
+
+
+class MountFS(FileSystem):
+    """A base filesystem with other filesystems mounted on directories.
+
+       A mounted filesystem is given the full path.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.mounts = {}  # path -> filesystem
+
+    def mount(self, path, fs):
+        self.mounts[os.path.abspath(path)] = fs
+
+    def unmount(self, path):
+        return self.mounts.pop(os.path.abspath(path), None)
+
+    def resolve(self, path):
+        """Return the filesystem serving path"""
+        if self.mounts:
+            p = os.path.abspath(path)
+            while True:
+                fs = self.mounts.get(p, None)
+                if fs is not None:
+                    return fs
+                head = os.path.dirname(p)
+                if head == p:
+                    break
+                p = head
+        return self.base
+
+    def stat(self, path):
+        return self.resolve(path).stat(path)
+
+    def listdir(self, path):
+        return self.resolve(path).listdir(path)
+
+    def open(self, path, mode='r', *args, **kwargs):
+        return self.resolve(path).open(path, mode, *args, **kwargs)
+
+    def isfile(self, path):
+        return self.resolve(path).isfile(path)
+
+    def isdir(self, path):
+        return self.resolve(path).isdir(path)
+
+    def exists(self, path):
+        return self.resolve(path).exists(path)
+
+    def read_text(self, path):
+        return self.resolve(path).read_text(path)
+
+    def read_bytes(self, path):
+        return self.resolve(path).read_bytes(path)
+
+    def get_code(self, path):
+        return self.resolve(path).get_code(path)
+
+    def is_shared(self, path):
+        return self.resolve(path).is_shared(path)